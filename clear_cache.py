@@ -1,16 +1,13 @@
-import os
 import shutil
+from pathlib import Path
 
 
 def clear_pycache(root="."):
-    for dirpath, dirnames, filenames in os.walk(root):
-        if "__pycache__" in dirnames:
-            path = os.path.join(dirpath, "__pycache__")
-            try:
-                shutil.rmtree(path)
-                print("Removed", path)
-            except Exception as e:
-                print("Skip", path, e)
+    # Список заранее: не удаляем каталоги под активным обходом rglob
+    for path in list(Path(root).rglob("__pycache__")):
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+            print("Removed", path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,20 @@
+"""
+Опциональный numba: если пакет не установлен, декоратор njit
+возвращает функцию без изменений (чистый Python).
+HAVE_NUMBA — ядра реально компилируются (False и при NUMBA_DISABLE_JIT=1):
+там, где цикл по numpy-скалярам без JIT медленнее векторного NumPy,
+вызывающий код выбирает векторную ветку.
+"""
+
+try:
+    from numba import config as _numba_config  # type: ignore
+    from numba import njit  # type: ignore
+
+    HAVE_NUMBA = not _numba_config.DISABLE_JIT
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda f: f
@@ -0,0 +1,28 @@
+"""
+Простейший TTL-кеш для функций с позиционными хешируемыми аргументами:
+результат живёт `ttl` секунд (по time.monotonic), потом запрашивается заново.
+"""
+
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+def ttl_cache(ttl: float) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    def deco(fn: Callable[..., Any]) -> Callable[..., Any]:
+        store: Dict[Hashable, Tuple[Any, float]] = {}
+
+        @wraps(fn)
+        def wrapper(*args: Hashable) -> Any:
+            now = time.monotonic()
+            hit = store.get(args)
+            if hit is not None and hit[1] > now:
+                return hit[0]
+            value = fn(*args)
+            store[args] = (value, now + ttl)
+            return value
+
+        wrapper.cache_clear = store.clear  # type: ignore[attr-defined]
+        return wrapper
+
+    return deco
@@ -0,0 +1,282 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Tuple
+
+import ccxt.async_support as ccxt_async
+import ccxt.pro as ccxt_pro
+
+from .bybit_exchange import exchange_config, get_exchange
+from .ohlcv_cache import feed_ohlcv
+
+
+def create_async_exchange() -> ccxt_async.bybit:
+    """
+    Async-клиент Bybit с теми же настройками, что и create_exchange().
+    Рынки и поправку времени берём из кешированного sync-клиента,
+    чтобы не повторять load_markets. Закрывать через `await ex.close()`.
+    """
+    sync_ex = get_exchange()
+    exchange = ccxt_async.bybit(exchange_config())
+
+    proxy = os.getenv("PROXY_URL")
+    if proxy:
+        exchange.aiohttp_proxy = proxy
+
+    exchange.set_markets(sync_ex.markets, sync_ex.currencies)
+    if "timeDifference" in sync_ex.options:
+        exchange.options["timeDifference"] = sync_ex.options["timeDifference"]
+    return exchange
+
+
+@lru_cache(maxsize=1)
+def get_pro_exchange() -> ccxt_pro.bybit:
+    """
+    Один долгоживущий websocket-клиент (ccxt.pro) на процесс: подписки
+    и соединение переживают вызовы. Использовать только из фонового цикла
+    (run_in_ws_loop / submit_to_ws_loop) — aiohttp привязан к своему loop.
+    """
+    sync_ex = get_exchange()
+    exchange = ccxt_pro.bybit(exchange_config())
+
+    proxy = os.getenv("PROXY_URL")
+    if proxy:
+        exchange.aiohttp_proxy = proxy
+
+    exchange.set_markets(sync_ex.markets, sync_ex.currencies)
+    if "timeDifference" in sync_ex.options:
+        exchange.options["timeDifference"] = sync_ex.options["timeDifference"]
+    return exchange
+
+
+_WS_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_WS_LOCK = threading.Lock()
+
+
+def _ws_loop() -> asyncio.AbstractEventLoop:
+    """Фоновый event loop в daemon-потоке под websocket-клиент."""
+    global _WS_LOOP
+    with _WS_LOCK:
+        if _WS_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="bybit-ws", daemon=True
+            ).start()
+            _WS_LOOP = loop
+    return _WS_LOOP
+
+
+def submit_to_ws_loop(coro: Awaitable[Any]):
+    """Запускает корутину в фоновом цикле, не дожидаясь результата."""
+    return asyncio.run_coroutine_threadsafe(coro, _ws_loop())
+
+
+def run_in_ws_loop(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Выполняет корутину в фоновом цикле и ждёт результат (из sync-кода)."""
+    return submit_to_ws_loop(coro).result(timeout)
+
+
+# Позиции из приватного канала position: symbol -> [позиции]. Таблица
+# подменяется целиком (атомарная перепривязка) — читатели из других потоков
+# всегда видят согласованный снимок
+POSITIONS_VIA_WS = os.getenv("POSITIONS_VIA_WS", "1") == "1"
+_WS_POSITIONS: Dict[str, List[Dict]] = {}
+_WS_POSITIONS_LIVE = threading.Event()
+_POSITION_STREAM_STARTED = False
+
+
+async def _position_stream() -> None:
+    global _WS_POSITIONS
+    ex = get_pro_exchange()
+    delay = 1.0
+    while True:
+        try:
+            # Первый вызов отдаёт REST-снимок, дальше — пуши биржи
+            await ex.watch_positions()
+            table: Dict[str, List[Dict]] = {}
+            for p in ex.positions or ():
+                table.setdefault(p.get("symbol"), []).append(p)
+            _WS_POSITIONS = table
+            _WS_POSITIONS_LIVE.set()
+            delay = 1.0
+        except Exception as e:
+            # Поток оборвался — до переподключения читаем позиции по REST
+            _WS_POSITIONS_LIVE.clear()
+            print(f"[WS_POS] stream error, retry in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+
+def start_position_stream() -> None:
+    """Запускает (один раз) фоновую подписку на позиции (POSITIONS_VIA_WS=1)."""
+    global _POSITION_STREAM_STARTED
+    if not POSITIONS_VIA_WS:
+        return
+    with _WS_LOCK:
+        if _POSITION_STREAM_STARTED:
+            return
+        _POSITION_STREAM_STARTED = True
+    submit_to_ws_loop(_position_stream())
+
+
+def ws_positions() -> Optional[Dict[str, List[Dict]]]:
+    """Таблица позиций из websocket; None — поток не поднят или оборвался."""
+    return _WS_POSITIONS if _WS_POSITIONS_LIVE.is_set() else None
+
+
+# Последние тикеры из публичного канала tickers: symbol -> (monotonic, ticker).
+# Старше WS_TICKER_MAX_AGE_S — не используем (пара затихла или поток упал)
+TICKERS_VIA_WS = os.getenv("TICKERS_VIA_WS", "1") == "1"
+WS_TICKER_MAX_AGE_S = float(os.getenv("WS_TICKER_MAX_AGE_S", "1.0"))
+_WS_TICKERS: Dict[str, Tuple[float, Dict]] = {}
+_TICKER_STREAM_STARTED = False
+
+
+async def _ticker_stream(symbols: List[str]) -> None:
+    ex = get_pro_exchange()
+    delay = 1.0
+    while True:
+        try:
+            tickers = await ex.watch_tickers(symbols)
+            now = time.monotonic()
+            for sym, t in tickers.items():
+                _WS_TICKERS[sym] = (now, t)
+            delay = 1.0
+        except Exception as e:
+            print(f"[WS_TICKER] stream error, retry in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+
+def start_ticker_stream(symbols: Iterable[str]) -> None:
+    """Запускает (один раз) фоновую подписку на тикеры пар (TICKERS_VIA_WS=1)."""
+    global _TICKER_STREAM_STARTED
+    if not TICKERS_VIA_WS:
+        return
+    with _WS_LOCK:
+        if _TICKER_STREAM_STARTED:
+            return
+        _TICKER_STREAM_STARTED = True
+    submit_to_ws_loop(_ticker_stream(list(symbols)))
+
+
+def ws_ticker(symbol: str) -> Optional[Dict]:
+    """Свежий тикер из websocket или None."""
+    hit = _WS_TICKERS.get(symbol)
+    if hit is None or time.monotonic() - hit[0] > WS_TICKER_MAX_AGE_S:
+        return None
+    return hit[1]
+
+
+# Свечи из канала kline вливаются в кеш core.ohlcv_cache: на новом баре
+# get_ohlcv не ходит за хвостом по REST
+OHLCV_VIA_WS = os.getenv("OHLCV_VIA_WS", "1") == "1"
+_OHLCV_STREAM_STARTED = False
+
+
+async def _ohlcv_stream(pairs: List[List[str]]) -> None:
+    ex = get_pro_exchange()
+    delay = 1.0
+    while True:
+        try:
+            update = await ex.watch_ohlcv_for_symbols(pairs)
+            for sym, by_tf in update.items():
+                for tf, candles in by_tf.items():
+                    feed_ohlcv(sym, tf, candles)
+            delay = 1.0
+        except Exception as e:
+            print(f"[WS_OHLCV] stream error, retry in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+
+def start_ohlcv_stream(symbols: Iterable[str], timeframes: Iterable[str]) -> None:
+    """Запускает (один раз) подписку на свечи пар по таймфреймам (OHLCV_VIA_WS=1)."""
+    global _OHLCV_STREAM_STARTED
+    if not OHLCV_VIA_WS:
+        return
+    with _WS_LOCK:
+        if _OHLCV_STREAM_STARTED:
+            return
+        _OHLCV_STREAM_STARTED = True
+    pairs = [[sym, tf] for sym in symbols for tf in dict.fromkeys(timeframes)]
+    submit_to_ws_loop(_ohlcv_stream(pairs))
+
+
+async def _cancel_all_async(sym: str, order_ids: List[str]) -> List[Any]:
+    ex = create_async_exchange()
+    try:
+        return await asyncio.gather(
+            *[ex.cancel_order(oid, sym) for oid in order_ids],
+            return_exceptions=True,
+        )
+    finally:
+        await ex.close()
+
+
+def cancel_orders_concurrently(sym: str, order_ids: List[str]) -> List[Any]:
+    """
+    Отменяет ордера параллельно: N отмен ≈ 1 RTT вместо N.
+    Возвращает результаты в порядке order_ids (исключения — как значения).
+    """
+    if not order_ids:
+        return []
+    return asyncio.run(_cancel_all_async(sym, order_ids))
+
+
+# Ордера через websocket trade API (/v5/trade) вместо REST; REST — запасной путь
+USE_WS_TRADE_API = os.getenv("USE_WS_TRADE_API", "0") == "1"
+WS_TRADE_TIMEOUT_S = float(os.getenv("WS_TRADE_TIMEOUT_S", "5"))
+
+
+def place_order(
+    exchange,
+    symbol: str,
+    order_type: str,
+    side: str,
+    amount: float,
+    price: Optional[float] = None,
+    params: Optional[Dict] = None,
+) -> Dict:
+    """
+    create_order через websocket-клиент (USE_WS_TRADE_API=1) с ACK-таймаутом
+    WS_TRADE_TIMEOUT_S; при ошибке — тот же ордер по REST через exchange.
+    Один clientOrderId на обе попытки: если WS-ордер всё же дошёл,
+    Bybit отклонит дубликат, а не откроет вторую позицию.
+    """
+    if not USE_WS_TRADE_API:
+        return exchange.create_order(
+            symbol, order_type, side, amount, price, params or {}
+        )
+
+    params = dict(params or {})
+    link_id = params.setdefault("clientOrderId", f"kg{uuid.uuid4().hex[:30]}")
+    try:
+        return run_in_ws_loop(
+            asyncio.wait_for(
+                get_pro_exchange().create_order_ws(
+                    symbol, order_type, side, amount, price, params
+                ),
+                WS_TRADE_TIMEOUT_S,
+            ),
+            WS_TRADE_TIMEOUT_S + 1,
+        )
+    except Exception as e:
+        print(f"[WS_TRADE] fallback to REST: {type(e).__name__} {e}")
+
+    try:
+        return exchange.create_order(symbol, order_type, side, amount, price, params)
+    except Exception as e:
+        if "duplicate" not in str(e).lower():
+            raise
+        # Ордер уже принят по websocket — id неизвестен, есть orderLinkId
+        print(f"[WS_TRADE] order {link_id} already placed via websocket")
+        return {
+            "id": None,
+            "clientOrderId": link_id,
+            "status": "placed",
+            "info": {"orderLinkId": link_id},
+        }
@@ -1,6 +1,73 @@
+import json
 import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
 
 import ccxt
+import requests
+from requests.adapters import HTTPAdapter
+
+# .env должен быть загружен до чтения флагов ниже и в модулях, импортирующих этот
+from . import env_loader  # noqa: F401
+
+# Снимок рынков на диске: холодный старт без загрузки всего instruments-info
+MARKETS_CACHE_PATH = os.getenv("MARKETS_CACHE_PATH", "markets.json")
+MARKETS_CACHE_MAX_AGE_S = float(os.getenv("MARKETS_CACHE_MAX_AGE_H", "24")) * 3600
+
+# Пинг /v5/market/time держит keep-alive соединение тёплым между ордерами (0 — выкл)
+KEEPALIVE_PING_S = float(os.getenv("KEEPALIVE_PING_S", "20"))
+
+
+def exchange_config() -> dict:
+    """Общие настройки клиента Bybit (sync и async)."""
+    recv_window = int(os.getenv("RECV_WINDOW", "20000"))
+    return {
+        "apiKey": os.getenv("BYBIT_API_KEY"),
+        "secret": os.getenv("BYBIT_SECRET_KEY"),
+        "enableRateLimit": True,
+        "options": {
+            "defaultType": "swap",  # Для деривативов
+            "adjustForTimeDifference": True,
+            "recvWindow": recv_window,
+        },
+    }
+
+
+def bootstrap_markets(exchange, path: str = MARKETS_CACHE_PATH) -> None:
+    """
+    Загружает рынки из файла, если он свежее MARKETS_CACHE_MAX_AGE_H;
+    иначе — load_markets() с биржи и сохраняет снимок в файл.
+    """
+    p = Path(path)
+    try:
+        if p.exists() and time.time() - p.stat().st_mtime < MARKETS_CACHE_MAX_AGE_S:
+            with p.open(encoding="utf-8") as f:
+                exchange.set_markets(json.load(f))
+            # load_markets() сам выставляет поправку часов — повторяем это вручную
+            if exchange.options.get("adjustForTimeDifference"):
+                exchange.load_time_difference()
+            return
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Кеш рынков {p} не прочитан, загружаю с биржи: {e}")
+
+    exchange.load_markets(reload=True)
+    try:
+        with p.open("w", encoding="utf-8") as f:
+            json.dump(exchange.markets, f)
+    except (OSError, TypeError) as e:
+        print(f"⚠️ Не удалось сохранить кеш рынков {p}: {e}")
+
+
+def _keepalive_session() -> requests.Session:
+    """Пул HTTPS-соединений для ccxt: повторные запросы без нового TLS-рукопожатия."""
+    session = requests.Session()
+    session.headers.update({"Connection": "keep-alive"})
+    session.mount(
+        "https://", HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0)
+    )
+    return session
 
 
 def create_exchange() -> ccxt.bybit:
@@ -8,27 +75,16 @@ def create_exchange() -> ccxt.bybit:
     Создает подключение к Bybit с поддержкой PROXY_URL и unified аккаунта.
     """
     proxy = os.getenv("PROXY_URL")
-    recv_window = int(os.getenv("RECV_WINDOW", "20000"))
 
-    exchange = ccxt.bybit(
-        {
-            "apiKey": os.getenv("BYBIT_API_KEY"),
-            "secret": os.getenv("BYBIT_SECRET_KEY"),
-            "enableRateLimit": True,
-            "options": {
-                "defaultType": "swap",  # Для деривативов
-                "adjustForTimeDifference": True,
-                "recvWindow": recv_window,
-            },
-        }
-    )
+    exchange = ccxt.bybit(exchange_config())
+    exchange.session = _keepalive_session()
 
     # Настройка прокси
     if proxy:
         exchange.proxies = {"http": proxy, "https": proxy}
 
     try:
-        exchange.load_markets(reload=True)
+        bootstrap_markets(exchange)
     except ccxt.AuthenticationError:
         print("⛔ Ошибка аутентификации: проверь BYBIT_API_KEY и BYBIT_SECRET_KEY.")
         raise
@@ -42,11 +98,85 @@ def create_exchange() -> ccxt.bybit:
     return exchange
 
 
+def _keepalive_loop(exchange, interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        try:
+            exchange.fetch_time()
+        except Exception:
+            # Пинг best-effort: ошибку увидит следующий настоящий запрос
+            pass
+
+
+def start_keepalive(
+    exchange, interval: float = KEEPALIVE_PING_S
+) -> Optional[threading.Event]:
+    """
+    Фоновый поток, периодически дёргающий fetch_time (TCP/TLS не остывают).
+    Возвращает Event для остановки; None — пинг выключен.
+    """
+    if interval <= 0:
+        return None
+    stop = threading.Event()
+    threading.Thread(
+        target=_keepalive_loop,
+        args=(exchange, interval, stop),
+        name="bybit-keepalive",
+        daemon=True,
+    ).start()
+    return stop
+
+
+def _serialize_http(exchange) -> None:
+    """
+    HTTP-вызовы клиента — через один замок: пинг keep-alive из своего потока
+    не пересекается с запросами владельца в общем requests.Session.
+    """
+    lock = threading.Lock()
+    fetch = exchange.fetch
+
+    def _locked_fetch(*args, **kwargs):
+        with lock:
+            return fetch(*args, **kwargs)
+
+    exchange.fetch = _locked_fetch
+
+
+# Синхронный ccxt-клиент (nonce, timeDifference, Session) не потокобезопасен:
+# у каждого потока свой клиент со своим пулом соединений и пингом
+_LOCAL = threading.local()
+
+
+def get_exchange() -> ccxt.bybit:
+    """
+    Клиент Bybit на поток: рынки загружаются один раз на клиент (из снимка
+    на диске), соединение переиспользуется между вызовами и держится тёплым пингом.
+    """
+    exchange = getattr(_LOCAL, "exchange", None)
+    if exchange is None:
+        exchange = create_exchange()
+        _serialize_http(exchange)
+        _LOCAL.keepalive_stop = start_keepalive(exchange)
+        _LOCAL.exchange = exchange
+    return exchange
+
+
+def invalidate_exchange() -> None:
+    """
+    Сбрасывает клиент текущего потока (например, после ошибки аутентификации
+    или в форкнутом воркере, унаследовавшем клиент родителя).
+    """
+    stop = getattr(_LOCAL, "keepalive_stop", None)
+    if stop is not None:
+        stop.set()
+    _LOCAL.exchange = None
+    _LOCAL.keepalive_stop = None
+
+
 def get_balance(coin: str):
     """
     Получает баланс в Unified аккаунте.
     """
-    exchange = create_exchange()
+    exchange = get_exchange()
     try:
         balance = exchange.fetch_balance(params={"accountType": "UNIFIED"})
         return balance[coin]["free"]
@@ -55,12 +185,20 @@ def get_balance(coin: str):
         return None
 
 
+# Кеш нормализованных символов: повторный вызов — один dict.get
+_NORM_CACHE: dict = {}
+
+
 def normalize_symbol(symbol: str) -> str:
     """
     BTC/USDT -> BTC/USDT:USDT
     """
+    cached = _NORM_CACHE.get(symbol)
+    if cached is not None:
+        return cached
     s = symbol.upper().replace(" ", "")
     if ":" not in s:
         base, quote = s.split("/")
         s = f"{base}/{quote}:{quote}"
+    _NORM_CACHE[symbol] = s
     return s
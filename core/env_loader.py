@@ -1,39 +1,94 @@
 import os
-from typing import Any, Dict, Iterable, Optional
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
 
 from dotenv import load_dotenv
 
 
-def load_and_check_env(required_keys: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Снимок настроек из окружения/.env, разобранный один раз при импорте."""
+
+    API_KEY: str
+    API_SECRET: str
+    DOMAIN: str
+    PROXY_URL: str
+    PAIRS: Tuple[str, ...]
+    LEVERAGE: int
+    AMOUNT: float
+    RISK_FRACTION: float
+    RECV_WINDOW: int
+    DRY_RUN: bool
+    TIMEFRAME: str
+    MODEL_DIR: str
+
+    def as_dict(self) -> Dict[str, Any]:
+        d = asdict(self)
+        d["PAIRS"] = list(self.PAIRS)
+        return d
+
+
+def _load_dotenv() -> None:
     load_dotenv()
     proxy_url = os.getenv("PROXY_URL", "").strip()
     if proxy_url:
         os.environ.setdefault("HTTP_PROXY", proxy_url)
         os.environ.setdefault("HTTPS_PROXY", proxy_url)
 
-    if required_keys:
-        missing = [k for k in required_keys if not os.getenv(k)]
-        if missing:
-            raise ValueError(f"Missing required env keys: {', '.join(missing)}")
 
-    cfg = {
-        "API_KEY": os.getenv("BYBIT_API_KEY", ""),
-        "API_SECRET": os.getenv("BYBIT_SECRET_KEY", ""),
-        "DOMAIN": os.getenv("DOMAIN", "bybit"),
-        "PROXY_URL": proxy_url,
-        "PAIRS": [
+def _load() -> Config:
+    return Config(
+        API_KEY=os.getenv("BYBIT_API_KEY", ""),
+        API_SECRET=os.getenv("BYBIT_SECRET_KEY", ""),
+        DOMAIN=os.getenv("DOMAIN", "bybit"),
+        PROXY_URL=os.getenv("PROXY_URL", "").strip(),
+        PAIRS=tuple(
             p.strip()
             for p in os.getenv("PAIRS", os.getenv("PAIR", "TON/USDT")).split(",")
             if p.strip()
-        ],
-        "LEVERAGE": int(os.getenv("LEVERAGE", "3")),
-        "AMOUNT": float(os.getenv("AMOUNT", "5")),
-        "RISK_FRACTION": float(os.getenv("RISK_FRACTION", "0.05")),
-        "RECV_WINDOW": int(os.getenv("RECV_WINDOW", "15000")),
-        "DRY_RUN": os.getenv("DRY_RUN", "true").lower() in ("1", "true", "yes"),
-    }
-    return cfg
-
-
-def normalize_symbol(pair: str) -> str:
-    return pair.replace("/", "").upper()
+        ),
+        LEVERAGE=int(os.getenv("LEVERAGE", "3")),
+        AMOUNT=float(os.getenv("AMOUNT", "5")),
+        RISK_FRACTION=float(os.getenv("RISK_FRACTION", "0.05")),
+        RECV_WINDOW=int(os.getenv("RECV_WINDOW", "15000")),
+        DRY_RUN=os.getenv("DRY_RUN", "true").lower() in ("1", "true", "yes"),
+        TIMEFRAME=os.getenv("TIMEFRAME", "5m"),
+        MODEL_DIR=os.getenv("MODEL_DIR", "models"),
+    )
+
+
+# .env — при импорте (модульные флаги других модулей читаются сразу после);
+# сам снимок Config собирается лениво, когда окружение уже настроено
+_load_dotenv()
+_CFG: Optional[Config] = None
+
+
+def get_config() -> Config:
+    """Снимок настроек; строится при первом обращении и кешируется."""
+    global _CFG
+    if _CFG is None:
+        _CFG = _load()
+    return _CFG
+
+
+def reload_config() -> Config:
+    """Пересобирает снимок — после того как код поменял os.environ (DRY_RUN и т.п.)."""
+    global _CFG
+    _CFG = _load()
+    return _CFG
+
+
+def __getattr__(name: str) -> Any:
+    # env_loader.CFG — ленивый снимок (совместимость со старым доступом)
+    if name == "CFG":
+        return get_config()
+    raise AttributeError(name)
+
+
+def load_and_check_env(required_keys: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    _load_dotenv()
+    if required_keys:
+        missing = [k for k in required_keys if not os.getenv(k)]
+        if missing:
+            raise ValueError(f"Missing required env keys: {', '.join(missing)}")
+    return reload_config().as_dict()
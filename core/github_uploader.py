@@ -1,8 +1,59 @@
 import base64
 import os
 from datetime import datetime
+from pathlib import Path
+from typing import Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+
+# Один HTTP-клиент на процесс: keep-alive между загрузками
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+# Кратно 3 байтам: base64 блоков склеивается без паддинга в середине
+_CHUNK = 3 * 64 * 1024
+
+
+def _sha_path(file_path: str) -> Path:
+    """logs/trades.csv -> logs/.trades.sha (последний известный sha в GitHub)."""
+    p = Path(file_path)
+    return p.with_name(f".{p.stem}.sha")
+
+
+def _read_sha(path: Path) -> Optional[str]:
+    try:
+        return path.read_text(encoding="utf-8").strip() or None
+    except OSError:
+        return None
+
+
+def _fetch_sha(url: str, headers: dict, branch: str) -> Optional[str]:
+    r = _SESSION.get(url, headers=headers, params={"ref": branch}, timeout=20)
+    return r.json().get("sha") if r.status_code == 200 else None
+
+
+def _encode_file(file_path: str) -> str:
+    """
+    base64 файла блоками в заранее выделенный буфер точного размера и одно
+    декодирование в str: в памяти буфер + итоговая строка, без списка блоков
+    и промежуточного join.
+    """
+    with open(file_path, "rb") as f:
+        # Размер фиксируем на открытии: дописанные во время чтения строки не берём
+        remaining = os.fstat(f.fileno()).st_size
+        out = bytearray(4 * ((remaining + 2) // 3))
+        pos = 0
+        while remaining > 0:
+            block = f.read(min(_CHUNK, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            enc = base64.b64encode(block)
+            end = pos + len(enc)
+            out[pos:end] = enc
+            pos = end
+    return out[:pos].decode("ascii") if pos != len(out) else out.decode("ascii")
 
 
 def upload_trades_to_github(file_path: str = "logs/trades.csv") -> None:
@@ -20,27 +71,40 @@ def upload_trades_to_github(file_path: str = "logs/trades.csv") -> None:
         return
 
     url = f"https://api.github.com/repos/{repo}/contents/{file_path}"
-    headers = {"Authorization": f"token {token}"}
-
-    # читаем локальный файл
-    with open(file_path, "rb") as f:
-        content = f.read()
-    encoded = base64.b64encode(content).decode("utf-8")
-
-    # получаем sha, если файл уже есть
-    r = requests.get(url, headers=headers, timeout=20)
-    sha = r.json().get("sha") if r.status_code == 200 else None
+    headers = {
+        "Authorization": f"token {token}",
+        "Accept": "application/vnd.github+json",
+    }
 
     data = {
         "message": f"update({file_path}) {datetime.utcnow().isoformat()}",
-        "content": encoded,
+        "content": _encode_file(file_path),
         "branch": branch,
     }
+
+    # sha берём из локального файла-спутника; GET — только если его нет
+    sha_file = _sha_path(file_path)
+    sha = _read_sha(sha_file) or _fetch_sha(url, headers, branch)
     if sha:
         data["sha"] = sha
 
-    r = requests.put(url, headers=headers, json=data, timeout=30)
+    r = _SESSION.put(url, headers=headers, json=data, timeout=30)
+    if r.status_code in (409, 422):
+        # Сохранённый sha устарел (файл меняли в обход нас) — перечитываем
+        sha = _fetch_sha(url, headers, branch)
+        if sha:
+            data["sha"] = sha
+        else:
+            data.pop("sha", None)
+        r = _SESSION.put(url, headers=headers, json=data, timeout=30)
+
     if r.status_code in (200, 201):
+        new_sha = (r.json().get("content") or {}).get("sha")
+        if new_sha:
+            try:
+                sha_file.write_text(new_sha, encoding="utf-8")
+            except OSError as e:
+                print(f"⚠️ не удалось сохранить sha в {sha_file}: {e}")
         print(f"✅ {file_path} загружен в GitHub")
     else:
         print(f"❌ upload error {r.status_code}: {r.text}")
@@ -1,16 +1,27 @@
 from typing import Dict, List
 
-from core.bybit_exchange import create_exchange
+import numpy as np
+
+from core._njit import njit
+from core.ohlcv_cache import get_ohlcv
+
+
+@njit(cache=True)
+def _sma_nb(values: np.ndarray, period: int) -> float:
+    total = 0.0
+    for i in range(values.shape[0] - period, values.shape[0]):
+        total += values[i]
+    return total / period
 
 
 def _sma(values: List[float], period: int) -> float:
     """
     Простейшее скользящее среднее. Возвращает среднее последних 'period' значений.
-    Если данных меньше, чем период, возвращает среднее всего списка.
+    Если данных меньше, чем период, возвращает 0.0.
     """
     if len(values) < period or period <= 0:
         return 0.0
-    return sum(values[-period:]) / float(period)
+    return float(_sma_nb(np.asarray(values, dtype=np.float64), period))
 
 
 def atr_latest_from_ohlcv(
@@ -33,28 +44,54 @@ def atr_latest_from_ohlcv(
     if not ohlcv:
         return 0.0, 0.0
 
-    if len(ohlcv) < period + 1:
+    if period <= 0 or len(ohlcv) < period + 1:
         last_close = float(ohlcv[-1][4])
         return 0.0, last_close
 
-    true_ranges: List[float] = []
+    # Нужны только последние period+1 свечей: не конвертируем всю историю
+    n = period + 1
+    arr = np.asarray(ohlcv[-n:], dtype=np.float64)
+    high = arr[1:, 2]
+    low = arr[1:, 3]
+    prev_close = arr[:-1, 4]
+
+    # True Range одним векторным проходом вместо цикла по свечам
+    true_ranges = np.maximum(
+        high - low,
+        np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)),
+    )
+
+    atr_value = float(true_ranges[-period:].mean())
+    last_close = float(arr[-1, 4])
+    return atr_value, last_close
 
-    for i in range(1, len(ohlcv)):
-        # текущие данные
-        _, _, high_price, low_price, _, _ = ohlcv[i]
-        # предыдущий close
-        _, _, _, _, prev_close, _ = ohlcv[i - 1]
 
-        range_high_low = float(high_price) - float(low_price)
-        range_high_prev = abs(float(high_price) - float(prev_close))
-        range_low_prev = abs(float(low_price) - float(prev_close))
+@njit(cache=True)
+def _ema_last_nb(vals: np.ndarray, period: int) -> float:
+    alpha = 2.0 / (period + 1.0)
+    ema = vals[0]
+    for i in range(1, vals.shape[0]):
+        ema = alpha * vals[i] + (1 - alpha) * ema
+    return ema
 
-        true_range = max(range_high_low, range_high_prev, range_low_prev)
-        true_ranges.append(true_range)
 
-    atr_value = float(_sma(true_ranges, period))
-    last_close = float(ohlcv[-1][4])
-    return atr_value, last_close
+def _make_ema_last(period: int):
+    """EMA-ядро с зашитой константой alpha (свёртывается при JIT-компиляции)."""
+    alpha = 2.0 / (period + 1.0)
+    beta = 1.0 - alpha
+
+    @njit(cache=True)
+    def _ema_last_fixed(vals: np.ndarray) -> float:
+        ema = vals[0]
+        for i in range(1, vals.shape[0]):
+            ema = alpha * vals[i] + beta * ema
+        return ema
+
+    return _ema_last_fixed
+
+
+# Специализации для периодов, которые реально используются (MACD, EMA50)
+_EMA_LAST_FIXED = {p: _make_ema_last(p) for p in (9, 12, 26, 50)}
 
 
 def _ema_last(vals: List[float], period: int) -> float:
@@ -62,33 +99,38 @@ def _ema_last(vals: List[float], period: int) -> float:
     Возвращает последнее значение экспоненциального скользящего среднего (EMA)
     для списка значений vals по заданному периоду.
     """
-    alpha = 2.0 / (period + 1.0)
-    ema = vals[0]
-    for v in vals[1:]:
-        ema = alpha * v + (1 - alpha) * ema
-    return ema
+    arr = np.asarray(vals, dtype=np.float64)
+    if arr.size == 0:
+        return 0.0
+    fixed = _EMA_LAST_FIXED.get(period)
+    if fixed is not None:
+        return float(fixed(arr))
+    return float(_ema_last_nb(arr, period))
 
 
-def _rsi_last(vals: List[float], period: int = 14) -> float:
-    """
-    Рассчитывает последнее значение индекса относительной силы (RSI).
-    """
-    gains: List[float] = []
-    losses: List[float] = []
-    for i in range(1, len(vals)):
-        change = vals[i] - vals[i - 1]
-        gains.append(max(change, 0.0))
-        losses.append(max(-change, 0.0))
-
-    if len(gains) < period:
+@njit(cache=True)
+def _rsi_last_nb(vals: np.ndarray, period: int) -> float:
+    n = vals.shape[0]
+    if n - 1 < period:
         return 50.0
 
-    avg_gain = sum(gains[:period]) / period
-    avg_loss = sum(losses[:period]) / period
-
-    for i in range(period, len(gains)):
-        avg_gain = (avg_gain * (period - 1) + gains[i]) / period
-        avg_loss = (avg_loss * (period - 1) + losses[i]) / period
+    avg_gain = 0.0
+    avg_loss = 0.0
+    for i in range(1, period + 1):
+        change = vals[i] - vals[i - 1]
+        if change > 0.0:
+            avg_gain += change
+        else:
+            avg_loss -= change
+    avg_gain /= period
+    avg_loss /= period
+
+    for i in range(period + 1, n):
+        change = vals[i] - vals[i - 1]
+        gain = change if change > 0.0 else 0.0
+        loss = -change if change < 0.0 else 0.0
+        avg_gain = (avg_gain * (period - 1) + gain) / period
+        avg_loss = (avg_loss * (period - 1) + loss) / period
 
     if avg_loss == 0:
         return 100.0
@@ -97,6 +139,13 @@ def _rsi_last(vals: List[float], period: int = 14) -> float:
     return 100.0 - (100.0 / (1.0 + rs))
 
 
+def _rsi_last(vals: List[float], period: int = 14) -> float:
+    """
+    Рассчитывает последнее значение индекса относительной силы (RSI).
+    """
+    return float(_rsi_last_nb(np.asarray(vals, dtype=np.float64), period))
+
+
 def _bb_last(vals: List[float], period: int = 20) -> Dict[str, float]:
     """
     Рассчитывает последние значения полос Боллинджера (BB) и их ширину.
@@ -106,9 +155,14 @@ def _bb_last(vals: List[float], period: int = 20) -> Dict[str, float]:
         mid = sum(vals) / len(vals)
         return {"mid": mid, "up": mid, "dn": mid, "width": 0.0}
 
-    recent_vals = vals[-period:]
-    mid = sum(recent_vals) / period
-    variance = sum((x - mid) ** 2 for x in recent_vals) / period
+    # Сумма и сумма квадратов за один проход: Var = E[x²] - (E[x])²
+    s = 0.0
+    s2 = 0.0
+    for x in vals[-period:]:
+        s += x
+        s2 += x * x
+    mid = s / period
+    variance = max(s2 / period - mid * mid, 0.0)
     sd = variance**0.5
     up = mid + 2 * sd
     dn = mid - 2 * sd
@@ -124,24 +178,25 @@ def compute_snapshot(
     Возвращает краткий набор индикаторов для дальнейшего анализа или логирования:
     EMA12, EMA26, MACD, MACD‑signal (по сигнальной EMA9), RSI14, Bollinger Bands и текущее закрытие.
     """
-    ex = create_exchange()
-    ohlcv = ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+    ohlcv = get_ohlcv(symbol, timeframe, limit)
     closes = [float(c[4]) for c in ohlcv]
 
     if len(closes) < 60:
         return {}
 
-    ema12 = _ema_last(closes, 12)
-    ema26 = _ema_last(closes, 26)
-    macd = ema12 - ema26
-
-    # “Сигнальная линия” MACD: EMA(9) от последовательности macd‑значений;
-    # для простоты считаем на последнем отрезке (последние 60 значений).
+    # EMA12/EMA26 и ряд MACD за один рекурсивный проход по закрытиям;
+    # “сигнальная линия” MACD — EMA(9) от macd‑значений начиная с 26‑й свечи.
+    a12 = 2.0 / 13.0
+    a26 = 2.0 / 27.0
+    ema12 = ema26 = closes[0]
     macd_series: List[float] = []
-    for i in range(26, len(closes)):
-        ema12_i = _ema_last(closes[: i + 1], 12)
-        ema26_i = _ema_last(closes[: i + 1], 26)
-        macd_series.append(ema12_i - ema26_i)
+    for i in range(1, len(closes)):
+        v = closes[i]
+        ema12 = a12 * v + (1 - a12) * ema12
+        ema26 = a26 * v + (1 - a26) * ema26
+        if i >= 26:
+            macd_series.append(ema12 - ema26)
+    macd = ema12 - ema26
 
     macd_signal = _ema_last(macd_series, 9) if macd_series else 0.0
     rsi = _rsi_last(closes, 14)
@@ -1,31 +1,180 @@
-from typing import Dict, List, Tuple
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
 
-from .bybit_exchange import create_exchange, normalize_symbol
+import ccxt
+
+from ._ttl_cache import ttl_cache
+from .bybit_async import cancel_orders_concurrently, ws_positions, ws_ticker
+from .bybit_exchange import get_exchange, normalize_symbol
+
+
+@ttl_cache(float(os.getenv("BALANCE_TTL_S", "10")))
+def fetch_balance_cached() -> Dict:
+    """fetch_balance с TTL; после create_order — fetch_balance_cached.cache_clear()."""
+    return get_exchange().fetch_balance()
+
+
+@ttl_cache(float(os.getenv("PRICE_TTL_S", "2")))
+def fetch_ticker_cached(sym: str) -> Dict:
+    return get_exchange().fetch_ticker(sym)
 
 
 def get_balance(asset: str = "USDT") -> float:
-    ex = create_exchange()
-    bal = ex.fetch_balance()
+    bal = fetch_balance_cached()
     return float(bal.get(asset, {}).get("free", 0.0) or 0.0)
 
 
-def get_symbol_price(symbol: str) -> float:
-    ex = create_exchange()
+def get_symbol_price(symbol: str, state: Optional[Dict] = None) -> float:
     sym = normalize_symbol(symbol)
-    t = ex.fetch_ticker(sym)
+    t = (
+        ws_ticker(sym)
+        or (state or {}).get("tickers", {}).get(sym)
+        or fetch_ticker_cached(sym)
+    )
     return float(t.get("last") or t.get("close") or 0.0)
 
 
+def _group_by_symbol(rows: List[Dict]) -> Dict[str, List[Dict]]:
+    out: Dict[str, List[Dict]] = {}
+    for r in rows:
+        out.setdefault(r.get("symbol"), []).append(r)
+    return out
+
+
+# Постоянные потоки: их клиенты (и keep-alive) живут между проходами
+_PREFETCH_POOL = ThreadPoolExecutor(max_workers=3, thread_name_prefix="prefetch")
+
+
+def prefetch_market_state(symbols: List[str]) -> Dict[str, Dict]:
+    """
+    Тикеры, позиции и открытые ордера по всем парам — по одному
+    bulk-запросу на ресурс вместо запросов на каждую пару.
+    Раздел, который не удалось получить, отсутствует в результате:
+    get_symbol_price / get_open_orders / has_open_position тогда
+    сходят на биржу поштучно, как раньше.
+    """
+    syms = [normalize_symbol(s) for s in symbols]
+    wanted = set(syms)
+
+    # Каждый запрос — клиентом своего потока (get_exchange() на поток)
+    def _orders() -> Dict[str, List[Dict]]:
+        # Без символа Bybit отдаёт одну страницу (20 ордеров) — идём по
+        # nextPageCursor страницами по 50, иначе хвостовые пары «без ордеров»
+        # (limit не передаём: ccxt обрезал бы им уже склеенный результат)
+        rows = get_exchange().fetch_open_orders(
+            params={"paginate": True, "paginationCalls": 20}
+        )
+        grouped = _group_by_symbol(rows)
+        return {k: v for k, v in grouped.items() if k in wanted}
+
+    def _tickers() -> Dict[str, Dict]:
+        return get_exchange().fetch_tickers(syms)
+
+    def _positions() -> Dict[str, List[Dict]]:
+        return _group_by_symbol(get_exchange().fetch_positions(syms))
+
+    # Позиции и тикеры поддерживают websocket-потоки — REST за ними не нужен
+    live = ws_positions()
+    ws_tickers = {s: ws_ticker(s) for s in syms}
+    if not all(ws_tickers.values()):
+        ws_tickers = None
+
+    # Запросы независимы — шлём параллельно: проход ждёт один RTT, а не три
+    futures = {"orders": _PREFETCH_POOL.submit(_orders)}
+    if ws_tickers is None:
+        futures["tickers"] = _PREFETCH_POOL.submit(_tickers)
+    if live is None:
+        futures["positions"] = _PREFETCH_POOL.submit(_positions)
+    labels = {
+        "tickers": "fetch_tickers",
+        "positions": "fetch_positions",
+        "orders": "fetch_open_orders (all)",
+    }
+    state: Dict[str, Dict] = {}
+    if ws_tickers is not None:
+        state["tickers"] = ws_tickers
+    if live is not None:
+        state["positions"] = {s: live[s] for s in syms if s in live}
+    for name, fut in futures.items():
+        try:
+            state[name] = fut.result()
+        except Exception as e:
+            print(f"[WARN] {labels[name]} failed: {e}")
+    return state
+
+
+# sym -> (market, amount_step, amount_decimals, price_step, price_decimals)
+_MKT_CACHE: Dict[str, Tuple[Dict, float, int, float, int]] = {}
+
+
+def _step_decimals(step: float) -> int:
+    return max(0, -Decimal(str(step)).as_tuple().exponent)
+
+
+def _market_steps(ex, sym: str) -> Tuple[Dict, float, int, float, int]:
+    """Рынок и шаги qty/price по символу — разбираются один раз на процесс."""
+    hit = _MKT_CACHE.get(sym)
+    if hit is None:
+        market = ex.market(sym)
+        amount_step = price_step = 0.0
+        if ex.precisionMode == ccxt.TICK_SIZE:
+            precision = market.get("precision") or {}
+            amount_step = float(precision.get("amount") or 0.0)
+            price_step = float(precision.get("price") or 0.0)
+        hit = (
+            market,
+            amount_step,
+            _step_decimals(amount_step) if amount_step > 0 else 0,
+            price_step,
+            _step_decimals(price_step) if price_step > 0 else 0,
+        )
+        _MKT_CACHE[sym] = hit
+    return hit
+
+
+def _round_to_step(
+    value: float, step: float, decimals: int, truncate: bool
+) -> Optional[float]:
+    """Округление к шагу биржи; None — шаг неизвестен, нужен путь через ccxt."""
+    if step <= 0:
+        return None
+    n = value / step
+    # 1e-9 гасит погрешность float (0.3 / 0.1 = 2.9999999999999996)
+    n = math.floor(n + 1e-9) if truncate else math.floor(n + 0.5 + 1e-9)
+    return round(n * step, decimals)
+
+
+def round_price(symbol: str, price: float, ex=None) -> float:
+    """Цена к ближайшему тику (как price_to_precision, но без Decimal-форматирования)."""
+    ex = ex or get_exchange()
+    sym = normalize_symbol(symbol)
+    _market, _a_step, _a_dec, price_step, price_dec = _market_steps(ex, sym)
+    r = _round_to_step(price, price_step, price_dec, truncate=False)
+    return r if r is not None else float(ex.price_to_precision(sym, price))
+
+
+def round_amount(symbol: str, qty: float, ex=None) -> float:
+    """Количество вниз к шагу лота (как amount_to_precision с TRUNCATE)."""
+    ex = ex or get_exchange()
+    sym = normalize_symbol(symbol)
+    _market, amount_step, amount_dec, _p_step, _p_dec = _market_steps(ex, sym)
+    r = _round_to_step(qty, amount_step, amount_dec, truncate=True)
+    return r if r is not None else float(ex.amount_to_precision(sym, qty))
+
+
 def adjust_qty_price(
     symbol: str, qty: float, price: float
 ) -> Tuple[float, float, Dict]:
     """Коррекция qty/price под биржевые шаги и минимальные требования (min amount / min cost)."""
-    ex = create_exchange()
+    ex = get_exchange()
     sym = normalize_symbol(symbol)
-    market = ex.market(sym)
+    market = _market_steps(ex, sym)[0]
 
-    qty_adj = float(ex.amount_to_precision(sym, qty))
-    price_adj = float(ex.price_to_precision(sym, price))
+    qty_adj = round_amount(sym, qty, ex)
+    price_adj = round_price(sym, price, ex)
 
     min_amount = market.get("limits", {}).get("amount", {}).get("min")
     min_cost = market.get("limits", {}).get("cost", {}).get("min")
@@ -37,9 +186,9 @@ def adjust_qty_price(
         need_qty = max(need_qty, float(min_cost) / max(price_adj, 1e-12))
 
     if need_qty > qty_adj:
-        qty_adj = float(ex.amount_to_precision(sym, need_qty))
+        qty_adj = round_amount(sym, need_qty, ex)
         if qty_adj < need_qty:  # страховка от float
-            qty_adj = float(ex.amount_to_precision(sym, need_qty * 1.0000001))
+            qty_adj = round_amount(sym, need_qty * 1.0000001, ex)
 
     return qty_adj, price_adj, market
 
@@ -47,10 +196,12 @@ def adjust_qty_price(
 # ======== ДОБАВЛЕНО: проверки ордеров/позиций ========
 
 
-def get_open_orders(symbol: str) -> List[Dict]:
+def get_open_orders(symbol: str, state: Optional[Dict] = None) -> List[Dict]:
     """Список открытых ордеров по символу (не исполнены/не отменены)."""
-    ex = create_exchange()
+    ex = get_exchange()
     sym = normalize_symbol(symbol)
+    if state and "orders" in state:
+        return state["orders"].get(sym, [])
     try:
         return ex.fetch_open_orders(sym)
     except Exception:
@@ -59,29 +210,37 @@ def get_open_orders(symbol: str) -> List[Dict]:
 
 def cancel_open_orders(symbol: str) -> int:
     """Отменяет ВСЕ открытые ордера по символу. Возвращает число отменённых."""
-    ex = create_exchange()
+    ex = get_exchange()
     sym = normalize_symbol(symbol)
     try:
         opened = ex.fetch_open_orders(sym)
-        for o in opened:
-            try:
-                ex.cancel_order(o["id"], sym)
-            except Exception as e:
+        ids = [o["id"] for o in opened]
+        results = cancel_orders_concurrently(sym, ids)
+        for oid, r in zip(ids, results):
+            if isinstance(r, Exception):
                 # Не глушим: фиксируем и идём дальше
-                print(f"[WARN] cancel_order failed symbol={sym} id={o.get('id')}: {e}")
-        return len(opened)
+                print(f"[WARN] cancel_order failed symbol={sym} id={oid}: {r}")
+        return sum(1 for r in results if not isinstance(r, Exception))
     except Exception as e:
         print(f"[ERROR] fetch_open_orders failed symbol={sym}: {e}")
         return 0
 
 
-def has_open_position(symbol: str) -> bool:
-    """Есть ли нетто‑позиция по символу (size != 0)."""
-    ex = create_exchange()
+def get_positions(symbol: str, state: Optional[Dict] = None) -> List[Dict]:
+    """Позиции по символу: снимок прохода, websocket-таблица или запрос к бирже."""
     sym = normalize_symbol(symbol)
+    if state and "positions" in state:
+        return state["positions"].get(sym, [])
+    live = ws_positions()
+    if live is not None:
+        return live.get(sym, [])
+    return get_exchange().fetch_positions([sym]) or []
+
+
+def has_open_position(symbol: str, state: Optional[Dict] = None) -> bool:
+    """Есть ли нетто‑позиция по символу (size != 0)."""
     try:
-        poss = ex.fetch_positions([sym])
-        for p in poss:
+        for p in get_positions(symbol, state):
             # Bybit/ccxt: contracts / size / info
             size = p.get("contracts") or p.get("size") or 0
             try:
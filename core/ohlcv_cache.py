@@ -0,0 +1,143 @@
+import os
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import ccxt
+
+from .bybit_exchange import get_exchange
+
+# Минимальная глубина запроса: один fetch покрывает predict/snapshot/ATR/фильтры
+_MIN_LIMIT = 500
+
+# Если пропущено больше свечей — проще перекачать окно целиком
+_MAX_TAIL_BARS = 50
+
+# (symbol, timeframe) -> (bar_bucket, fetched_limit, rows)
+_CACHE: Dict[Tuple[str, str], Tuple[int, int, List[List[float]]]] = {}
+
+# (symbol, timeframe) -> monotonic-дедлайн, до которого свечей не запрашиваем
+_NO_DATA: Dict[Tuple[str, str], float] = {}
+_NO_DATA_TTL_S = float(os.getenv("OHLCV_NO_DATA_TTL_S", "600"))
+
+
+def _merge_tail(
+    rows: List[List[float]], tail: List[List[float]], keep: int, tf_ms: int
+) -> Optional[List[List[float]]]:
+    """
+    Склеивает кеш с догруженным хвостом: свечи с ts >= первой свечи хвоста
+    (включая недоформированную последнюю) заменяются; хвост, начинающийся
+    ровно со следующей свечи, дописывается. None — между кешем и хвостом
+    пропуск свечей, нужен полный fetch.
+    """
+    if not tail or not rows:
+        return None
+    first_ts = tail[0][0]
+    if first_ts == rows[-1][0] + tf_ms:
+        # Стык без перекрытия: WS шлёт только обновлённую свечу нового бара
+        return (rows + tail)[-keep:]
+    i = len(rows)
+    while i > 0 and rows[i - 1][0] >= first_ts:
+        i -= 1
+    if i == len(rows):
+        return None
+    merged = rows[:i] + tail
+    return merged[-keep:]
+
+
+def feed_ohlcv(symbol: str, timeframe: str, tail: List[List[float]]) -> bool:
+    """
+    Вливает в кеш свечи из websocket-потока kline (включая формирующуюся).
+    Работает только поверх уже закешированного окна; False — склеить не
+    удалось, следующий get_ohlcv докачает по REST.
+    """
+    key = (symbol, timeframe)
+    hit = _CACHE.get(key)
+    if hit is None or not tail:
+        return False
+    # Строки ccxt.pro живут в его кеше — копируем, кеш отдаёт их наружу
+    rows = _merge_tail(
+        hit[2], [list(r) for r in tail], hit[1], timeframe_seconds(timeframe) * 1000
+    )
+    if rows is None:
+        return False
+    bucket = int(rows[-1][0] // 1000 // timeframe_seconds(timeframe))
+    _CACHE[key] = (max(bucket, hit[0]), hit[1], rows)
+    return True
+
+
+@lru_cache(maxsize=32)
+def timeframe_seconds(timeframe: str) -> int:
+    """'5m' -> 300; разбор строки — один раз на таймфрейм."""
+    return int(ccxt.Exchange.parse_timeframe(timeframe))
+
+
+def get_ohlcv(symbol: str, timeframe: str, limit: int, ex=None) -> List[List[float]]:
+    """
+    OHLCV [ts, open, high, low, close, volume] c кешем на время текущего бара.
+    В пределах одной свечи повторные запросы по той же паре/таймфрейму
+    не ходят в сеть; возвращается хвост из `limit` свечей.
+    Возвращаемые строки общие для всех вызовов — не мутировать.
+    """
+    bucket = int(time.time() // timeframe_seconds(timeframe))
+    key = (symbol, timeframe)
+    hit = _CACHE.get(key)
+    if hit is not None and hit[1] >= limit:
+        if hit[0] == bucket:
+            return hit[2][-limit:]
+        # Новая свеча: докачиваем только пропущенный хвост, а не всё окно
+        missed = bucket - hit[0]
+        if missed <= _MAX_TAIL_BARS:
+            ex = ex or get_exchange()
+            tail = ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=missed + 2)
+            rows = _merge_tail(
+                hit[2], tail, hit[1], timeframe_seconds(timeframe) * 1000
+            )
+            if rows is not None:
+                _CACHE[key] = (bucket, hit[1], rows)
+                return rows[-limit:]
+
+    # Данных по паре нет (не торгуется/делистинг) — не долбим биржу до TTL
+    if time.monotonic() < _NO_DATA.get(key, 0.0):
+        return []
+
+    fetch_limit = max(limit, _MIN_LIMIT)
+    ex = ex or get_exchange()
+    try:
+        rows = ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=fetch_limit)
+    except ccxt.BadSymbol:
+        rows = []
+    if not rows:
+        _NO_DATA[key] = time.monotonic() + _NO_DATA_TTL_S
+        return []
+    _NO_DATA.pop(key, None)
+    _CACHE[key] = (bucket, fetch_limit, rows)
+    return rows[-limit:]
+
+
+def fetch_ohlcv_range(
+    symbol: str, timeframe: str, since: int, limit: int, ex=None
+) -> List[List[float]]:
+    """
+    До `limit` свечей начиная с `since` (мс), постранично по 1000.
+    Окно каждой страницы задаётся явно (until): без него Bybit отдаёт
+    самые свежие свечи после start, а не первые.
+    """
+    ex = ex or get_exchange()
+    tf_ms = timeframe_seconds(timeframe) * 1000
+    now_ms = int(time.time() * 1000)
+    rows: List[List[float]] = []
+    while len(rows) < limit and since <= now_ms:
+        n = min(1000, limit - len(rows))
+        page = ex.fetch_ohlcv(
+            symbol,
+            timeframe=timeframe,
+            since=since,
+            limit=n,
+            params={"until": since + n * tf_ms - 1},
+        )
+        if not page:
+            break
+        rows.extend(page)
+        since = int(page[-1][0]) + tf_ms
+    return rows
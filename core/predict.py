@@ -1,5 +1,7 @@
 # core/predict.py
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, Optional, Tuple
 
@@ -8,39 +10,67 @@ import numpy as np
 import pandas as pd
 from xgboost import XGBClassifier
 
-from .bybit_exchange import create_exchange, normalize_symbol
+from ._njit import njit
+from .bybit_exchange import invalidate_exchange, normalize_symbol
+from .env_loader import get_config
+from .ohlcv_cache import fetch_ohlcv_range, get_ohlcv
 
 
+@lru_cache(maxsize=256)
 def pair_key(symbol: str) -> str:
     return normalize_symbol(symbol).upper().replace("/", "").replace(":USDT", "")
 
 
 def _fetch_ohlcv(
-    symbol: str, timeframe: str = "15m", limit: int = 2000
+    symbol: str,
+    timeframe: str = "15m",
+    limit: int = 2000,
+    since: Optional[int] = None,
 ) -> pd.DataFrame:
-    ex = create_exchange()
     sym = normalize_symbol(symbol)
-    raw = ex.fetch_ohlcv(sym, timeframe=timeframe, limit=limit)
-    df = pd.DataFrame(
-        raw, columns=["timestamp", "open", "high", "low", "close", "volume"]
+    if since is None:
+        raw = get_ohlcv(sym, timeframe, limit)
+    else:
+        raw = fetch_ohlcv_range(sym, timeframe, since, limit)
+    # Одно приведение к float64 (N, 6) и колонки-срезы вместо построчного разбора
+    arr = np.asarray(raw, dtype=np.float64).reshape(-1, 6)
+    return pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime(
+                arr[:, 0].astype(np.int64), unit="ms", utc=True
+            ),
+            "open": arr[:, 1],
+            "high": arr[:, 2],
+            "low": arr[:, 3],
+            "close": arr[:, 4],
+            "volume": arr[:, 5],
+        }
     )
-    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms", utc=True)
-    return df
+
+
+@njit(cache=True)
+def _rsi_nb(close: np.ndarray, period: int) -> np.ndarray:
+    """RSI одним проходом: EMA(alpha=1/period) прироста/падения в регистрах."""
+    n = close.shape[0]
+    out = np.empty(n, dtype=np.float64)
+    if n == 0:
+        return out
+    a = 1.0 / period
+    gain = 0.0
+    loss = 0.0
+    out[0] = 0.0
+    for i in range(1, n):
+        delta = close[i] - close[i - 1]
+        gain = a * (delta if delta > 0.0 else 0.0) + (1.0 - a) * gain
+        loss = a * (-delta if delta < 0.0 else 0.0) + (1.0 - a) * loss
+        out[i] = 100.0 - (100.0 / (1.0 + gain / (loss + 1e-12)))
+    return out
 
 
 def compute_rsi(series: pd.Series, period: int = 14) -> pd.Series:
-    delta = series.diff()
-    gain = np.where(delta > 0, delta, 0.0)
-    loss = np.where(delta < 0, -delta, 0.0)
-    gain_ema = (
-        pd.Series(gain, index=series.index).ewm(alpha=1 / period, adjust=False).mean()
-    )
-    loss_ema = (
-        pd.Series(loss, index=series.index).ewm(alpha=1 / period, adjust=False).mean()
+    return pd.Series(
+        _rsi_nb(series.to_numpy(dtype=np.float64), period), index=series.index
     )
-    rs = gain_ema / (loss_ema + 1e-12)
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
 
 
 def _ema(series: pd.Series, span: int) -> pd.Series:
@@ -59,10 +89,52 @@ def compute_macd(
     return macd, sig, hist
 
 
+@njit(cache=True)
+def _last_features_nb(
+    close: np.ndarray,
+    ema_span: int,
+    rsi_period: int,
+    fast: int,
+    slow: int,
+    signal: int,
+) -> Tuple[float, float, float, float]:
+    """
+    Последние значения (ema, rsi, macd, signal) за один рекурсивный проход —
+    те же формулы, что ewm(adjust=False) в compute_rsi/compute_macd.
+    """
+    a_ema = 2.0 / (ema_span + 1.0)
+    a_fast = 2.0 / (fast + 1.0)
+    a_slow = 2.0 / (slow + 1.0)
+    a_sig = 2.0 / (signal + 1.0)
+    a_rsi = 1.0 / rsi_period
+
+    ema = ema_fast = ema_slow = close[0]
+    sig = 0.0
+    gain = 0.0
+    loss = 0.0
+    for i in range(1, close.shape[0]):
+        v = close[i]
+        ema = a_ema * v + (1.0 - a_ema) * ema
+        ema_fast = a_fast * v + (1.0 - a_fast) * ema_fast
+        ema_slow = a_slow * v + (1.0 - a_slow) * ema_slow
+        sig = a_sig * (ema_fast - ema_slow) + (1.0 - a_sig) * sig
+        delta = v - close[i - 1]
+        gain = a_rsi * (delta if delta > 0.0 else 0.0) + (1.0 - a_rsi) * gain
+        loss = a_rsi * (-delta if delta < 0.0 else 0.0) + (1.0 - a_rsi) * loss
+
+    rsi = 100.0 - (100.0 / (1.0 + gain / (loss + 1e-12)))
+    return ema, rsi, ema_fast - ema_slow, sig
+
+
 def train_model_for_pair(
-    symbol: str, timeframe: str = "5m", limit: int = 3000, model_dir: str = "models"
+    symbol: str,
+    timeframe: str = "5m",
+    limit: int = 3000,
+    model_dir: str = "models",
+    n_jobs: int = 2,
+    since: Optional[int] = None,
 ) -> float:
-    df = _fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+    df = _fetch_ohlcv(symbol, timeframe=timeframe, limit=limit, since=since)
     if df.empty or len(df) < 200:
         raise RuntimeError(f"Недостаточно данных для {symbol}")
 
@@ -91,7 +163,7 @@ def train_model_for_pair(
         colsample_bytree=0.9,
         reg_lambda=1.0,
         objective="binary:logistic",
-        n_jobs=2,
+        n_jobs=n_jobs,
         random_state=42,
     )
     model.fit(Xtr, Ytr)
@@ -104,23 +176,67 @@ def train_model_for_pair(
     return acc
 
 
-def train_many(pairs, timeframe="5m", limit=3000, model_dir="models"):
-    for p in pairs:
-        try:
-            train_model_for_pair(
-                p, timeframe=timeframe, limit=limit, model_dir=model_dir
+def _worker_init() -> None:
+    """
+    Воркер пула форкается с клиентом родителя и его keep-alive
+    сокетами — сбрасываем, чтобы воркер открыл своё соединение.
+    """
+    invalidate_exchange()
+
+
+def train_many(
+    pairs,
+    timeframe="5m",
+    limit=3000,
+    model_dir="models",
+    since: Optional[Dict[str, int]] = None,
+):
+    """
+    Обучает модели по парам параллельно в пуле процессов: загрузка OHLCV
+    и обучение XGBoost для разных пар не ждут друг друга.
+    Каждый воркер обучает в один поток, чтобы не переподписывать ядра.
+    since — необязательное начало окна обучения (мс) по паре.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return
+    os.makedirs(model_dir, exist_ok=True)
+    since = since or {}
+    workers = max(1, min(len(pairs), (os.cpu_count() or 2) // 2))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_worker_init) as pool:
+        futs = {}
+        for p in pairs:
+            print(f"\n📈 Обучение модели для {p}...")
+            fut = pool.submit(
+                train_model_for_pair, p, timeframe, limit, model_dir, 1, since.get(p)
             )
-        except Exception as e:
-            print(f"⚠️ {p}: {e}")
+            futs[fut] = p
+        for fut in as_completed(futs):
+            p = futs[fut]
+            try:
+                print(f"✅ {p} — готово, вал.точность {fut.result():.4f}")
+            except Exception as e:
+                print(f"⚠️ {p} — ошибка обучения: {e}")
+
+
+@lru_cache(maxsize=64)
+def _load_model(path: str, mtime: float) -> Any:
+    """Загружает модель один раз на (путь, mtime): переобучение сбрасывает кеш."""
+    model = joblib.load(path)
+    # Инференс по одной строке: пул потоков XGBoost только мешает
+    try:
+        model.get_booster().set_param({"nthread": 1})
+    except Exception:
+        pass
+    return model
 
 
 def predict_trend(
-    symbol: str, timeframe: Optional[str] = None, limit: int = 500
+    symbol: str, timeframe: Optional[str] = None, limit: int = 260
 ) -> Dict[str, Any]:
-    tf = timeframe or os.getenv("TIMEFRAME", "5m")
-    model_path = (
-        Path(os.getenv("MODEL_DIR", "models")) / f"model_{pair_key(symbol)}.pkl"
-    )
+    cfg = get_config()
+    tf = timeframe or cfg.TIMEFRAME
+    model_path = Path(cfg.MODEL_DIR) / f"model_{pair_key(symbol)}.pkl"
     if not model_path.exists():
         return {
             "signal": "hold",
@@ -128,7 +244,7 @@ def predict_trend(
             "proba": {"LONG": 0.0, "SHORT": 0.0},
         }
 
-    model = joblib.load(model_path)
+    model = _load_model(str(model_path), model_path.stat().st_mtime)
     df = _fetch_ohlcv(symbol, timeframe=tf, limit=limit)
     if df.empty:
         return {
@@ -137,14 +253,11 @@ def predict_trend(
             "proba": {"LONG": 0.0, "SHORT": 0.0},
         }
 
-    df["ema"] = df["close"].ewm(span=50, adjust=False).mean()
-    df["rsi"] = compute_rsi(df["close"], period=14)
-    macd, sig, _hist = compute_macd(df["close"])
-    df["macd"] = macd
-    df["signal"] = sig
-    df = df.dropna().reset_index(drop=True)
-
-    feats = df[["close", "ema", "rsi", "macd", "signal"]].values[-1:].astype(float)
+    # Для одного прогноза нужны только последние значения признаков
+    close = df["close"].to_numpy(dtype=np.float64)
+    last_close = float(close[-1])
+    last_ema, rsi, macd, sig = _last_features_nb(close, 50, 14, 12, 26, 9)
+    feats = np.array([[last_close, last_ema, rsi, macd, sig]], dtype=np.float32)
     try:
         proba = model.predict_proba(feats)[0]
         p_short, p_long = float(proba[0]), float(proba[1])  # [SHORT, LONG]
@@ -156,8 +269,6 @@ def predict_trend(
             "proba": {"LONG": p_long, "SHORT": p_short},
         }
     except Exception:
-        last_close = float(df["close"].iloc[-1])
-        last_ema = float(df["ema"].iloc[-1])
         signal = "long" if last_close > last_ema else "short"
         return {
             "signal": signal,
@@ -172,23 +283,38 @@ def predict_trend(
 # ---- indicators & filters (без дубликатов) ----
 
 
+@njit(cache=True)
+def _wilder_ema_nb(values: np.ndarray, period: int) -> np.ndarray:
+    """Рекурсия ewm(alpha=1/period, adjust=False) одним проходом."""
+    n = values.shape[0]
+    out = np.empty(n, dtype=np.float64)
+    if n == 0:
+        return out
+    a = 1.0 / period
+    acc = values[0]
+    out[0] = acc
+    for i in range(1, n):
+        acc = a * values[i] + (1.0 - a) * acc
+        out[i] = acc
+    return out
+
+
 def compute_atr(df: pd.DataFrame, period=14) -> pd.Series:
-    prev_close = df["close"].shift(1)
-    tr = pd.concat(
-        [
-            df["high"] - df["low"],
-            (df["high"] - prev_close).abs(),
-            (df["low"] - prev_close).abs(),
-        ],
-        axis=1,
-    ).max(axis=1)
-    atr = tr.ewm(alpha=1 / period, adjust=False).mean()
-    return atr
+    h = df["high"].to_numpy(dtype=np.float64)
+    lo = df["low"].to_numpy(dtype=np.float64)
+    c = df["close"].to_numpy(dtype=np.float64)
+    pc = np.empty_like(c)
+    if len(c):
+        pc[0] = np.nan
+        pc[1:] = c[:-1]
+    # fmax пропускает NaN первой свечи, как max(axis=1) в pandas
+    tr = np.fmax(h - lo, np.fmax(np.abs(h - pc), np.abs(lo - pc)))
+    return pd.Series(_wilder_ema_nb(tr, period), index=df.index)
 
 
 def get_recent_atr(ex, symbol: str, timeframe="1h", period=14, limit=None) -> float:
     limit = limit or (period * 3 + 2)
-    ohlcv = ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+    ohlcv = get_ohlcv(symbol, timeframe, limit, ex=ex)
     df = pd.DataFrame(ohlcv, columns=["ts", "open", "high", "low", "close", "vol"])
     atr = compute_atr(df[["open", "high", "low", "close"]], period)
     return float(atr.iloc[-1])
@@ -203,15 +329,17 @@ def entry_filter_confirm(
     rsi_thr_short=45,
     regime_ema=200,
 ):
-    ohlcv = ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=max(regime_ema, 260))
+    ohlcv = get_ohlcv(symbol, timeframe, max(regime_ema, 260), ex=ex)
     df = pd.DataFrame(ohlcv, columns=["ts", "open", "high", "low", "close", "vol"])
     close = df["close"]
-    ema50 = _ema(close, 50).iloc[-1]
-    ema200_now = _ema(close, regime_ema).iloc[-1]
-    ema200_prev = _ema(close, regime_ema).iloc[-2]
-    rsi = compute_rsi(close, 14).iloc[-1]
-    macd, sig, hist = compute_macd(close)
-    macd_hist = float(hist.iloc[-1])
+    ema200 = _ema(close, regime_ema)
+    ema200_now = float(ema200.iloc[-1])
+    ema200_prev = float(ema200.iloc[-2])
+    # EMA50/RSI/MACD нужны только на последней свече — один скалярный проход
+    ema50, rsi, macd, sig = _last_features_nb(
+        close.to_numpy(dtype=np.float64), 50, 14, 12, 26, 9
+    )
+    macd_hist = float(macd - sig)
     px = float(close.iloc[-1])
 
     regime_long = px > ema200_now and ema200_now > ema200_prev
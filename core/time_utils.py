@@ -2,6 +2,11 @@ from datetime import datetime, timezone
 from typing import Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+# Keep-alive между вызовами: без повторного TLS-рукопожатия
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
 
 
 def now_utc() -> datetime:
@@ -10,7 +15,7 @@ def now_utc() -> datetime:
 
 def get_bybit_server_time() -> int:
     # Public endpoint; works without auth
-    r = requests.get("https://api.bybit.com/v5/market/time", timeout=10)
+    r = _SESSION.get("https://api.bybit.com/v5/market/time", timeout=10)
     r.raise_for_status()
     data = r.json()
     return int(data.get("result", {}).get("timeSecond", 0))
@@ -1,9 +1,12 @@
 # core/trade_log.py
+import atexit
 import csv
 import os
+import queue
+import threading
 import time
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Tuple
 
 LOG_PATH = Path(os.getenv("TRADE_LOG_PATH", "logs/trades.csv"))
 LOG_TO_STDOUT = (
@@ -24,33 +27,125 @@ FIELDS = [
     "mode",
     "extra",
 ]
+_REST_FIELDS = tuple(FIELDS[1:])  # FIELDS[0] == "ts"
+_DEFAULTS = {
+    "extra": "",
+    "tp": "",
+    "sl": "",
+    "order_id": "",
+    "link_id": "",
+    "mode": "LIVE",
+}
+
+
+# Файл открывается один раз на процесс; запись — под блокировкой
+_lock = threading.Lock()
+_fh = None
+_writer = None
+
+# Запись на диск вынесена из пути ордера: события копятся в очереди,
+# фоновый поток сбрасывает их пачками (по 64 строки или раз в 250 мс)
+_QUEUE: "queue.Queue[Tuple]" = queue.Queue(maxsize=10000)
+_BATCH = 64
+_FLUSH_S = 0.25
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def _get_writer():
+    global _fh, _writer
+    if _writer is None:
+        LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _fh = LOG_PATH.open("a", newline="", encoding="utf-8")
+        _writer = csv.writer(_fh)
+        if _fh.tell() == 0:
+            _writer.writerow(FIELDS)
+    return _writer
+
+
+def _write_rows(rows: List[Tuple]) -> None:
+    with _lock:
+        _get_writer().writerows(rows)
+        _fh.flush()
+
+
+_STOP: Tuple = ()  # маркер остановки фонового потока
+
+
+def _drain(block: bool) -> bool:
+    """
+    Забирает из очереди пачку (до _BATCH строк) и пишет её одним flush.
+    False — встречен маркер остановки.
+    """
+    rows: List[Tuple] = []
+    alive = True
+    try:
+        rows.append(_QUEUE.get(timeout=_FLUSH_S) if block else _QUEUE.get_nowait())
+        while len(rows) < _BATCH and rows[-1] is not _STOP:
+            rows.append(_QUEUE.get_nowait())
+    except queue.Empty:
+        pass
+    if rows and rows[-1] is _STOP:
+        rows.pop()
+        alive = False
+    if rows:
+        _write_rows(rows)
+    return alive
+
+
+def _writer_loop() -> None:
+    while True:
+        try:
+            if not _drain(block=True):
+                return
+        except Exception as e:
+            print("[TRADE_LOG_ERR]", e)
+
+
+def _ensure_thread() -> None:
+    global _thread
+    if _thread is not None:
+        return
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(
+                target=_writer_loop, name="trade-log", daemon=True
+            )
+            _thread.start()
+
+
+@atexit.register
+def _shutdown() -> None:
+    """Дописывает хвост очереди при выходе процесса и закрывает файл."""
+    if _thread is not None and _thread.is_alive():
+        try:
+            _QUEUE.put(_STOP, timeout=1.0)
+            _thread.join(timeout=5.0)
+        except queue.Full:
+            pass
+    while not _QUEUE.empty():
+        _drain(block=False)
+    with _lock:
+        if _fh is not None:
+            _fh.close()
 
 
 def append_trade_event(row: Dict) -> None:
-    # подготовка CSV
-    LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
-    write_header = not LOG_PATH.exists()
-
-    # значения по умолчанию
-    row = dict(row)
-    row.setdefault("ts", time.time())
-    row.setdefault("extra", "")
-    row.setdefault("tp", "")
-    row.setdefault("sl", "")
-    row.setdefault("order_id", "")
-    row.setdefault("link_id", "")
-    row.setdefault("mode", "LIVE")
-
-    # запись в CSV
-    with LOG_PATH.open("a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=FIELDS)
-        if write_header:
-            w.writeheader()
-        w.writerow({k: row.get(k, "") for k in FIELDS})
-        f.flush()
+    # Строка фиксированной схемы (кортеж в порядке FIELDS) вместо копии dict
+    ts = row["ts"] if "ts" in row else time.time()
+    rec = (ts,) + tuple(row.get(k, _DEFAULTS.get(k, "")) for k in _REST_FIELDS)
+
+    # запись в CSV — фоновым потоком; при переполнении очереди пишем сами,
+    # чтобы не терять сделки
+    _ensure_thread()
+    try:
+        _QUEUE.put_nowait(rec)
+    except queue.Full:
+        _write_rows([rec])
 
     # печать в stdout (Railway logs)
     if LOG_TO_STDOUT:
+        row = dict(zip(FIELDS, rec))
         print(
             f"[TRADE] event={row.get('event')} "
             f"sym={row.get('symbol')} side={row.get('side')} qty={row.get('qty')} "
@@ -1,12 +1,43 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
+import threading
 import time
-from typing import Any, Dict, List, Tuple
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from ._njit import HAVE_NUMBA, njit
+from .market_info import round_price
+from .ohlcv_cache import get_ohlcv, timeframe_seconds
 
 logger = logging.getLogger("trailing_stop")
 
+# DEBUG_TRAILING=1 — выводить [TS_CALC]/[TS_PARAMS] в stderr
+if os.getenv("DEBUG_TRAILING", "0") == "1":
+    logger.setLevel(logging.DEBUG)
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+
+__all__ = [
+    "TSConfig",
+    "TokenBucket",
+    "compute_atr",
+    "compute_trailing_from_atr",
+    "maybe_breakeven",
+    "move_stop_loss",
+    "set_sl_and_trail",
+    "set_stop_loss_only",
+    "set_trailing_stop_async",
+    "set_trailing_stop_ccxt",
+    "update_trailing_for_symbol",
+    "update_trailing_many",
+    "verify_trailing_state",
+]
+
 # Не критично, но пусть импорт будет безопасным
 try:
     import ccxt  # type: ignore
@@ -17,24 +48,77 @@ except Exception:
 _RATE_DELAY = float(os.getenv("BYBIT_RATE_LIMIT_DELAY", "0.4"))  # ~3 rps
 
 
+@dataclass(frozen=True, slots=True)
+class TSConfig:
+    """Параметры трейлинга из окружения; .env уже подгружен core.env_loader."""
+
+    mode: str
+    tf: str
+    period: int
+    atr_k: float
+    up_pct: float
+    down_pct: float
+    min_up_pct: float
+    min_dn_pct: float
+    auto_cb: bool
+    auto_cb_k: float
+    cb_rate: float
+
+    @classmethod
+    def from_env(cls) -> "TSConfig":
+        return cls(
+            mode=os.getenv("TS_ACTIVATION_MODE", "atr").lower(),
+            tf=os.getenv("ATR_TIMEFRAME", "5m"),
+            period=int(os.getenv("ATR_PERIOD", "14")),
+            atr_k=float(os.getenv("TS_ACTIVATION_ATR_K", "1.0")),
+            up_pct=float(os.getenv("TS_ACTIVATION_UP_PCT", "0.003")),
+            down_pct=float(os.getenv("TS_ACTIVATION_DOWN_PCT", "0.003")),
+            min_up_pct=float(os.getenv("TS_ACTIVATION_MIN_UP_PCT", "0.001")),
+            min_dn_pct=float(os.getenv("TS_ACTIVATION_MIN_DOWN_PCT", "0.001")),
+            auto_cb=bool(int(os.getenv("TS_CALLBACK_RATE_AUTO", "0"))),
+            auto_cb_k=float(os.getenv("TS_CALLBACK_RATE_ATR_K", "0.75")),
+            cb_rate=float(os.getenv("TS_CALLBACK_RATE", "1.0")),
+        )
+
+
+_TSCFG = TSConfig.from_env()
+
+
 # ---------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------
+# symbol -> id рынка: рынки одни на площадку, от конкретного клиента не зависят
+_MARKET_ID_CACHE: Dict[str, str] = {}
+
+
 def _market_id(exchange, unified_symbol: str) -> str:
     """
     Преобразует унифицированный символ CCXT (например 'BTC/USDT:USDT')
     в биржевой id Bybit v5 (например 'BTCUSDT').
     """
-    exchange.load_markets(reload=False)
-    m = exchange.market(unified_symbol)
-    return m["id"]
+    mid = _MARKET_ID_CACHE.get(unified_symbol)
+    if mid is None:
+        exchange.load_markets(reload=False)
+        mid = exchange.market(unified_symbol)["id"]
+        _MARKET_ID_CACHE[unified_symbol] = mid
+    return mid
 
 
 # core/trailing_stop.py  [ADD near helpers]
+_POS_IDX = {"long": 1, "buy": 1, "short": 2, "sell": 2}
+
+
 def _position_idx_for_side(side: str | None) -> int:
     """Bybit v5: 1 = Long, 2 = Short (для линейных контрактов, tpslMode=Full)."""
-    s = (side or "").lower()
-    return 1 if s in ("long", "buy") else 2
+    return _POS_IDX.get((side or "").lower(), 2)
+
+
+class _BybitRetError(RuntimeError):
+    """Ошибка retCode из ответа Bybit; код — отдельным полем, а не в тексте."""
+
+    def __init__(self, message: str, ret_code: Any) -> None:
+        super().__init__(message)
+        self.ret_code = ret_code
 
 
 def _assert_ok(resp: Dict[str, Any]) -> None:
@@ -48,8 +132,9 @@ def _assert_ok(resp: Dict[str, Any]) -> None:
     if str(rc) == "110043":
         logger.warning("Bybit retCode=110043 (not modified) — считаем как OK")
         return
-    raise RuntimeError(
-        f"Bybit error retCode={rc}, retMsg={resp.get('retMsg')}, result={resp.get('result')}"
+    raise _BybitRetError(
+        f"Bybit error retCode={rc}, retMsg={resp.get('retMsg')}, result={resp.get('result')}",
+        rc,
     )
 
 
@@ -59,34 +144,157 @@ def _backoff_sleep(attempt: int) -> None:
     time.sleep(delay)
 
 
-def _dbg(*args, **kwargs):
-    """Печататет отладку по трейлингу, если DEBUG_TRAILING=1."""
-    try:
-        if os.getenv("DEBUG_TRAILING", "0") == "1":
-            print(*args, **kwargs, flush=True)
-    except Exception:
-        pass
+class TokenBucket:
+    """
+    Токен-бакет, общий для всех символов и потоков: всплеск до `capacity`
+    запросов проходит сразу, дальше — не чаще `rate` в секунду.
+    Скорость адаптивная: при 10006/429 падает вдвое, после серии
+    успешных ответов понемногу растёт обратно (не выше max_rate).
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        *,
+        min_rate: float = 0.5,
+        max_rate: float = 5.0,
+        grow_after: int = 10,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.grow_after = grow_after
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._ok_streak = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Забирает токен и возвращает, сколько секунд ждать до его выдачи."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            # Резервируем токен сразу: ожидающие встают в очередь, а не в гонку
+            self._tokens -= 1.0
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self._ok_streak += 1
+            if self._ok_streak >= self.grow_after:
+                self.rate = min(self.max_rate, self.rate + 0.25)
+                self._ok_streak = 0
+
+    def on_throttled(self) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * 0.5)
+            self._ok_streak = 0
+
+
+_BUCKET = TokenBucket(rate=1.0 / max(_RATE_DELAY, 1e-3), capacity=6)
+
+
+# 10006 — too many visits, 10018 — лимит по IP
+_RATE_LIMIT_CODES = frozenset({"10006", "10018"})
+
+
+def _is_rate_limited(e: Exception) -> bool:
+    if ccxt is not None and isinstance(
+        e, (ccxt.RateLimitExceeded, ccxt.DDoSProtection)
+    ):
+        return True
+    # По коду, а не по тексту: в сообщении лежит result с ценами/объёмами
+    rc = getattr(e, "ret_code", None)
+    return rc is not None and str(rc) in _RATE_LIMIT_CODES
+
+
+def _post_trading_stop(
+    exchange, payload: Dict[str, Any], what: str, max_retries: int
+) -> Dict[str, Any]:
+    """POST /v5/position/trading-stop через общий токен-бакет, с ретраями/backoff."""
+    for attempt in range(1, max_retries + 1):
+        _BUCKET.acquire()
+        try:
+            resp = exchange.private_post_v5_position_trading_stop(payload)
+            _assert_ok(resp)
+            _BUCKET.on_success()
+            return resp
+        except Exception as e:
+            if _is_rate_limited(e):
+                _BUCKET.on_throttled()
+            logger.debug(
+                "%s retry %s/%s for %s: %s",
+                what,
+                attempt,
+                max_retries,
+                payload.get("symbol"),
+                e,
+            )
+            if attempt >= max_retries:
+                raise
+            _backoff_sleep(attempt)
+
+
+async def _post_trading_stop_async(
+    aexchange, payload: Dict[str, Any], what: str, max_retries: int
+) -> Dict[str, Any]:
+    """Async-вариант _post_trading_stop: тот же бакет, ожидание без блокировки цикла."""
+    for attempt in range(1, max_retries + 1):
+        await _BUCKET.acquire_async()
+        try:
+            resp = await aexchange.private_post_v5_position_trading_stop(payload)
+            _assert_ok(resp)
+            _BUCKET.on_success()
+            return resp
+        except Exception as e:
+            if _is_rate_limited(e):
+                _BUCKET.on_throttled()
+            logger.debug(
+                "%s retry %s/%s for %s: %s",
+                what,
+                attempt,
+                max_retries,
+                payload.get("symbol"),
+                e,
+            )
+            if attempt >= max_retries:
+                raise
+            await asyncio.sleep(min(_RATE_DELAY * (2 ** (attempt - 1)), 2.0))
 
 
 def _fetch_ohlcv(
     exchange, symbol: str, timeframe: str, limit: int
 ) -> List[List[float]]:
-    # Формат: [ts, open, high, low, close, volume]
-    return exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
-
-
-def _sma(values: List[float], period: int) -> float:
-    n = len(values)
-    if period <= 0:
-        return 0.0
-    if n < period:
-        return sum(values) / max(1, n)
-    return sum(values[-period:]) / float(period)
+    # Формат: [ts, open, high, low, close, volume]. Через общий кеш свечей:
+    # predict/open_position в этом же баре уже скачали ту же пару/таймфрейм
+    return get_ohlcv(symbol, timeframe, limit, ex=exchange)
 
 
 # ---------------------------------------------------------------------
 # Индикаторы
 # ---------------------------------------------------------------------
+# (symbol, timeframe, period, limit, wilder) -> (bucket, expiry_ts, atr, last_close)
+_ATR_CACHE: Dict[Tuple[str, str, int, int, bool], Tuple[int, float, float, float]] = {}
+# Чистка протухших записей — не чаще раза в _ATR_SWEEP_S, а не на каждый промах
+_ATR_SWEEP_S = 60.0
+_atr_next_sweep = 0.0
+
+
 def compute_atr(
     exchange,
     symbol: str,
@@ -94,36 +302,167 @@ def compute_atr(
     period: int = 14,
     *,
     limit: int | None = None,
+    wilder: bool = False,
 ) -> tuple[float, float]:
     """
     Возвращает (atr, last_close).
     TR = max(H-L, |H-C_prev|, |L-C_prev|)
-    ATR = SMA(TR, period)
+    ATR = SMA(TR, period), при wilder=True — сглаживание Уайлдера.
+    В пределах одной свечи таймфрейма результат берётся из кеша (без fetch_ohlcv).
     """
     if limit is None:
         limit = max(period + 1, 100)
 
-    ohlcv = _fetch_ohlcv(exchange, symbol, timeframe, limit)
+    global _atr_next_sweep
+    tf_s = timeframe_seconds(timeframe)
+    now = time.time()
+    bucket = int(now // tf_s)
+    key = (symbol, timeframe, period, limit, wilder)
+    hit = _ATR_CACHE.get(key)
+    if hit is not None and hit[0] == bucket:
+        return hit[2], hit[3]
+
+    atr, last_close = _atr_from_ohlcv(
+        _fetch_ohlcv(exchange, symbol, timeframe, limit), period, wilder
+    )
+
+    # Срок жизни — две свечи своего таймфрейма: бакеты разных таймфреймов
+    # несравнимы, поэтому храним абсолютный момент протухания
+    if now >= _atr_next_sweep:
+        _atr_next_sweep = now + _ATR_SWEEP_S
+        # Снимок: пары идут в потоках
+        for k in [k for k, v in list(_ATR_CACHE.items()) if v[1] < now]:
+            _ATR_CACHE.pop(k, None)
+    _ATR_CACHE[key] = (bucket, (bucket + 2) * tf_s, atr, last_close)
+    return atr, last_close
+
+
+@njit(cache=True)
+def _true_range_nb(h: np.ndarray, lo: np.ndarray, c: np.ndarray) -> np.ndarray:
+    """TR для свечей 1..n-1 (нужен предыдущий close) одним проходом."""
+    n = h.shape[0]
+    tr = np.empty(n - 1, dtype=h.dtype)
+    for i in range(1, n):
+        pc = c[i - 1]
+        a = h[i] - lo[i]
+        b = abs(h[i] - pc)
+        d = abs(lo[i] - pc)
+        tr[i - 1] = a if (a > b and a > d) else (b if b > d else d)
+    return tr
+
+
+@njit(cache=True)
+def _atr_sma_nb(h: np.ndarray, lo: np.ndarray, c: np.ndarray, period: int) -> float:
+    tr = _true_range_nb(h, lo, c)
+    total = 0.0
+    for i in range(tr.shape[0] - period, tr.shape[0]):
+        total += tr[i]
+    return total / period
+
+
+@njit(cache=True)
+def _atr_wilder_nb(h: np.ndarray, lo: np.ndarray, c: np.ndarray, period: int) -> float:
+    tr = _true_range_nb(h, lo, c)
+    atr = 0.0
+    for i in range(period):
+        atr += tr[i]
+    atr /= period
+    for i in range(period, tr.shape[0]):
+        atr = (atr * (period - 1) + tr[i]) / period
+    return atr
+
+
+def _atr_from_ohlcv(
+    ohlcv: List[List[float]], period: int, wilder: bool = False
+) -> tuple[float, float]:
     if len(ohlcv) < period + 1:
         last_close = float(ohlcv[-1][4]) if ohlcv else 0.0
         return 0.0, last_close
 
-    trs: List[float] = []
-    for i in range(1, len(ohlcv)):
-        high = float(ohlcv[i][2])
-        low = float(ohlcv[i][3])
-        prev_close = float(ohlcv[i - 1][4])
-        tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
-        trs.append(tr)
-
-    atr = _sma(trs, period)
+    # float64: у дорогих символов (BTC ~1e5) шаг float32 ~0.008 искажает TR
+    a = np.asarray(ohlcv, dtype=np.float64)
+    if not HAVE_NUMBA:
+        # Без JIT ядра — цикл по numpy-скалярам: векторный NumPy быстрее
+        h = a[1:, 2]
+        lo = a[1:, 3]
+        pc = a[:-1, 4]
+        tr = np.maximum(h - lo, np.maximum(np.abs(h - pc), np.abs(lo - pc)))
+        if wilder:
+            trl = tr.tolist()
+            atr = sum(trl[:period]) / period
+            for x in trl[period:]:
+                atr = (atr * (period - 1) + x) / period
+        else:
+            atr = float(tr[-period:].mean())
+        return float(atr), float(ohlcv[-1][4])
+    h = np.ascontiguousarray(a[:, 2])
+    lo = np.ascontiguousarray(a[:, 3])
+    c = np.ascontiguousarray(a[:, 4])
+    kernel = _atr_wilder_nb if wilder else _atr_sma_nb
+    atr = float(kernel(h, lo, c, period))
     last_close = float(ohlcv[-1][4])
-    return float(atr), last_close
+    return atr, last_close
 
 
 # ---------------------------------------------------------------------
 # Низкоуровневые врапперы Bybit v5 (через ccxt)
 # ---------------------------------------------------------------------
+# Неизменная часть тела trading-stop; в вызове копируется и дополняется
+_TS_PAYLOAD_TMPL: Dict[str, Any] = {
+    "category": "linear",
+    "tpslMode": "Full",
+    "tpOrderType": "Market",
+    "slOrderType": "Market",
+}
+
+
+def _num_str(x: float, digits: int = 10) -> str:
+    """Число строкой для Bybit: без хвостовых нулей и без экспоненты."""
+    s = format(x, f".{digits}g")
+    if "e" in s:
+        s = format(x, ".12f").rstrip("0").rstrip(".")
+    return s
+
+
+# bybit-символ -> (activePrice, trailingStop, positionIdx) последнего успешного
+# POST; одинаковые параметры повторно не шлём (Bybit ответил бы 110043)
+_LAST_TS: Dict[str, Tuple[str, str, str]] = {}
+_CACHED_NOOP = {"retCode": 0, "retMsg": "cached-noop"}
+
+
+def _ts_sig(payload: Dict[str, Any]) -> Tuple[str, str, str]:
+    # Цена уже на шаге тика, поэтому сравнение строк = "в пределах тика"
+    return payload["activePrice"], payload["trailingStop"], payload["positionIdx"]
+
+
+def _trailing_payload(
+    bybit_symbol: str,
+    activation_price: float,
+    callback_rate: float,
+    *,
+    category: str,
+    tpsl_mode: str,
+    position_idx: int | None,
+    trigger_by: str,
+    side: str | None,
+) -> Dict[str, Any]:
+    # Определим корректный positionIdx по стороне
+    if position_idx is None or position_idx == 0:
+        position_idx = _position_idx_for_side(side)
+
+    p = _TS_PAYLOAD_TMPL.copy()
+    if category != "linear":
+        p["category"] = category
+    if tpsl_mode != "Full":
+        p["tpslMode"] = tpsl_mode
+    p["symbol"] = bybit_symbol
+    p["positionIdx"] = str(position_idx)
+    p["trailingStop"] = _num_str(callback_rate, 4)  # строка, % (0.1..5.0)
+    p["activePrice"] = _num_str(activation_price)  # строка
+    p["tpTriggerBy"] = p["slTriggerBy"] = trigger_by
+    return p
+
+
 # core/trailing_stop.py  [REPLACE function set_trailing_stop_ccxt]
 def set_trailing_stop_ccxt(
     exchange,
@@ -142,41 +481,70 @@ def set_trailing_stop_ccxt(
     POST /v5/position/trading-stop (ccxt: privatePostV5PositionTradingStop)
     Важно: числовые параметры — строками. Для хедж-режима обязательно positionIdx.
     """
-    bybit_symbol = _market_id(exchange, symbol)
-    # Определим корректный positionIdx по стороне
-    if position_idx is None or position_idx == 0:
-        position_idx = _position_idx_for_side(side)
-
-    payload = {
-        "category": category,
-        "symbol": bybit_symbol,
-        "tpslMode": tpsl_mode,
-        "positionIdx": str(position_idx),
-        "trailingStop": f"{callback_rate}",  # строка, % (0.1..5.0)
-        "activePrice": f"{activation_price}",  # строка
-        "tpOrderType": "Market",
-        "slOrderType": "Market",
-        "tpTriggerBy": trigger_by,
-        "slTriggerBy": trigger_by,
-    }
+    payload = _trailing_payload(
+        _market_id(exchange, symbol),
+        activation_price,
+        callback_rate,
+        category=category,
+        tpsl_mode=tpsl_mode,
+        position_idx=position_idx,
+        trigger_by=trigger_by,
+        side=side,
+    )
+    sig = _ts_sig(payload)
+    if _LAST_TS.get(payload["symbol"]) == sig:
+        return dict(_CACHED_NOOP)
 
     # Отправка с ретраями / backoff
-    for attempt in range(1, max_retries + 1):
-        try:
-            resp = exchange.private_post_v5_position_trading_stop(payload)
-            _assert_ok(resp)
-            return resp
-        except Exception as e:
-            logger.debug(
-                "trailing_stop retry %s/%s for %s: %s",
-                attempt,
-                max_retries,
-                payload.get("symbol"),
-                e,
-            )
-            if attempt >= max_retries:
-                raise
-            _backoff_sleep(attempt)
+    try:
+        resp = _post_trading_stop(exchange, payload, "trailing_stop", max_retries)
+    except Exception:
+        _LAST_TS.pop(payload["symbol"], None)
+        raise
+    _LAST_TS[payload["symbol"]] = sig
+    return resp
+
+
+async def set_trailing_stop_async(
+    aexchange,
+    symbol: str,
+    activation_price: float,
+    callback_rate: float = 1.0,
+    *,
+    category: str = "linear",
+    tpsl_mode: str = "Full",
+    position_idx: int | None = None,
+    trigger_by: str = "LastPrice",
+    max_retries: int = 3,
+    side: str | None = None,
+) -> Dict[str, Any]:
+    """
+    То же, что set_trailing_stop_ccxt, но для async-клиента
+    (core.bybit_async.create_async_exchange — рынки уже загружены).
+    """
+    payload = _trailing_payload(
+        aexchange.market(symbol)["id"],
+        activation_price,
+        callback_rate,
+        category=category,
+        tpsl_mode=tpsl_mode,
+        position_idx=position_idx,
+        trigger_by=trigger_by,
+        side=side,
+    )
+    sig = _ts_sig(payload)
+    if _LAST_TS.get(payload["symbol"]) == sig:
+        return dict(_CACHED_NOOP)
+
+    try:
+        resp = await _post_trading_stop_async(
+            aexchange, payload, "trailing_stop", max_retries
+        )
+    except Exception:
+        _LAST_TS.pop(payload["symbol"], None)
+        raise
+    _LAST_TS[payload["symbol"]] = sig
+    return resp
 
 
 def verify_trailing_state(
@@ -184,9 +552,18 @@ def verify_trailing_state(
 ) -> Dict[str, Any]:
     """GET /v5/position/list — текущее состояние позиции (есть ли trailingStop/stopLoss)."""
     bybit_symbol = _market_id(exchange, symbol)
-    return exchange.privateGetV5PositionList(
+    resp = exchange.privateGetV5PositionList(
         {"category": category, "symbol": bybit_symbol}
     )
+    # Сверка с биржей: трейла нет (закрыли позицию, сняли руками) — забываем
+    # последний отправленный, иначе следующий POST сочтётся повтором
+    rows = (resp.get("result") or {}).get("list") or []
+    if not any(
+        str(r.get("trailingStop") or "").strip() not in ("", "0", "0.0", "None")
+        for r in rows
+    ):
+        _LAST_TS.pop(bybit_symbol, None)
+    return resp
 
 
 def set_stop_loss_only(
@@ -219,22 +596,45 @@ def set_stop_loss_only(
         "slTriggerBy": trigger_by,
     }
 
-    for attempt in range(1, max_retries + 1):
-        try:
-            resp = exchange.private_post_v5_position_trading_stop(payload)
-            _assert_ok(resp)
-            return resp
-        except Exception as e:
-            logger.debug(
-                "stop_loss_only %s/%s for %s: %s",
-                attempt,
-                max_retries,
-                payload.get("symbol"),
-                e,
-            )
-            if attempt >= max_retries:
-                raise
-            _backoff_sleep(attempt)
+    return _post_trading_stop(exchange, payload, "stop_loss_only", max_retries)
+
+
+def set_sl_and_trail(
+    exchange,
+    symbol: str,
+    *,
+    sl: float,
+    active: float,
+    cb: float,
+    side: str | None = None,
+    category: str = "linear",
+    tpsl_mode: str = "Full",
+    position_idx: int | None = None,
+    trigger_by: str = "LastPrice",
+    max_retries: int = 3,
+) -> Dict[str, Any]:
+    """
+    SL и трейлинг одним POST /v5/position/trading-stop:
+    один RTT и один токен лимита вместо двух вызовов подряд.
+    """
+    payload = _trailing_payload(
+        _market_id(exchange, symbol),
+        active,
+        cb,
+        category=category,
+        tpsl_mode=tpsl_mode,
+        position_idx=position_idx,
+        trigger_by=trigger_by,
+        side=side,
+    )
+    payload["stopLoss"] = _num_str(sl)
+    try:
+        resp = _post_trading_stop(exchange, payload, "sl_and_trail", max_retries)
+    except Exception:
+        _LAST_TS.pop(payload["symbol"], None)
+        raise
+    _LAST_TS[payload["symbol"]] = _ts_sig(payload)
+    return resp
 
 
 def move_stop_loss(
@@ -309,29 +709,14 @@ def maybe_breakeven(
     - ATR-режим: как только профит >= be_atr_k*ATR → SL в район entry*(1±offset)
     - %-режим: триггер по проценту от entry (be_trigger_pct)
     """
-    side_l = side.lower()
-    if be_mode == "atr":
-        in_profit = (last - entry) if side_l in ("long", "buy") else (entry - last)
-        if in_profit >= be_atr_k * atr:
-            return (
-                entry * (1.0 + be_offset_pct)
-                if side_l in ("long", "buy")
-                else entry * (1.0 - be_offset_pct)
-            )
-    else:
-        need = entry * be_trigger_pct
-    if (side_l in ("long", "buy") and last >= entry + need) or (
-        side_l in ("short", "sell") and last <= entry - need
-    ):
-        return (
-            entry * (1.0 + be_offset_pct)
-            if side_l in ("long", "buy")
-            else entry * (1.0 - be_offset_pct)
-        )
-    return None
+    # +1 для лонга, -1 для шорта: одна формула для обеих сторон и режимов
+    sgn = 1.0 if side.lower() in ("long", "buy") else -1.0
+    profit = sgn * (last - entry)
+    trig = be_atr_k * atr if be_mode == "atr" else entry * be_trigger_pct
+    return entry * (1.0 + sgn * be_offset_pct) if profit >= trig else None
 
 
-def update_trailing_for_symbol(
+def _resolve_trailing(
     exchange,
     symbol: str,
     entry_price: float,
@@ -346,56 +731,36 @@ def update_trailing_for_symbol(
     callback_rate: float | None = None,
     auto_callback: bool | None = None,
     auto_cb_k: float | None = None,
-) -> Dict[str, Any]:
+) -> tuple[float, float]:
     """
-    Устанавливает трейлинг-стоп:
+    Считает параметры трейлинга (activePrice по шагу цены, callback %):
       mode="atr":  LONG → entry + K*ATR ; SHORT → entry - K*ATR
       mode="pct":  LONG → entry*(1+up_pct) ; SHORT → entry*(1-down_pct)
     Все параметры можно задать через .env.
     """
-    activation_mode = (
-        activation_mode or os.getenv("TS_ACTIVATION_MODE", "atr")
-    ).lower()
-
-    # Параметры ATR/процентов
-    atr_timeframe = atr_timeframe or os.getenv("ATR_TIMEFRAME", "5m")
-    atr_period = int(atr_period or int(os.getenv("ATR_PERIOD", "14")))
-    atr_k = float(atr_k or float(os.getenv("TS_ACTIVATION_ATR_K", "1.0")))
-
-    up_pct = (
-        float(os.getenv("TS_ACTIVATION_UP_PCT", "0.003"))
-        if up_pct is None
-        else float(up_pct)
-    )
-    down_pct = (
-        float(os.getenv("TS_ACTIVATION_DOWN_PCT", "0.003"))
-        if down_pct is None
-        else float(down_pct)
-    )
-    min_up_pct = float(os.getenv("TS_ACTIVATION_MIN_UP_PCT", "0.001"))
-    min_dn_pct = float(os.getenv("TS_ACTIVATION_MIN_DOWN_PCT", "0.001"))
+    cfg = _TSCFG
+    activation_mode = (activation_mode or cfg.mode).lower()
 
-    auto_callback = (
-        bool(int(os.getenv("TS_CALLBACK_RATE_AUTO", "0")))
-        if auto_callback is None
-        else bool(auto_callback)
-    )
-    auto_cb_k = (
-        float(os.getenv("TS_CALLBACK_RATE_ATR_K", "0.75"))
-        if auto_cb_k is None
-        else float(auto_cb_k)
-    )
-    callback_rate = (
-        float(os.getenv("TS_CALLBACK_RATE", "1.0"))
-        if callback_rate is None
-        else float(callback_rate)
-    )
+    # Параметры ATR/процентов: явный аргумент важнее .env
+    atr_timeframe = atr_timeframe or cfg.tf
+    atr_period = int(atr_period or cfg.period)
+    atr_k = float(atr_k or cfg.atr_k)
+
+    up_pct = cfg.up_pct if up_pct is None else float(up_pct)
+    down_pct = cfg.down_pct if down_pct is None else float(down_pct)
+    min_up_pct = cfg.min_up_pct
+    min_dn_pct = cfg.min_dn_pct
+
+    auto_callback = cfg.auto_cb if auto_callback is None else bool(auto_callback)
+    auto_cb_k = cfg.auto_cb_k if auto_cb_k is None else float(auto_cb_k)
+    callback_rate = cfg.cb_rate if callback_rate is None else float(callback_rate)
 
     side_l = (side or "").lower()
 
     # --- Расчёт активации и шага ---
     active = None
     cb_pct = None
+    atr = None
 
     if activation_mode == "atr":
         atr, _ = compute_atr(exchange, symbol, atr_timeframe, atr_period)
@@ -422,28 +787,25 @@ def update_trailing_for_symbol(
             active = entry_price * (1.0 - max(min_dn_pct, down_pct))
         cb_pct = callback_rate
 
-    # Отладка расчёта (до округления)
-    try:
-        print(
-            "[TS_CALC]",
+    # Отладка расчёта (до округления); dict строим только при DEBUG
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "TS_CALC %s",
             {
                 "symbol": symbol,
                 "mode": activation_mode,
-                "entry": float(entry_price),
+                "entry": entry_price,
                 "side": side_l,
                 "atr_period": atr_period,
                 "atr_tf": atr_timeframe,
-                "activation_raw": float(active),
-                "callback_pct_raw": float(cb_pct),
+                "activation_raw": active,
+                "callback_pct_raw": cb_pct,
             },
-            flush=True,
         )
-    except Exception:
-        pass
 
     # --- Подгон к шагу цены ---
     try:
-        active_precise = float(exchange.price_to_precision(symbol, active))
+        active_precise = round_price(symbol, active, exchange)
     except Exception:
         active_precise = float(active)
 
@@ -454,24 +816,48 @@ def update_trailing_for_symbol(
         cb_pct = 1.0
 
     # Отладочный снимок конечных параметров
-    try:
-        atr_dbg = None
-        if activation_mode == "atr":
-            atr_dbg, _ = compute_atr(exchange, symbol, atr_timeframe, atr_period)
-        print(
-            "[TS_PARAMS]",
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "TS_PARAMS %s",
             {
                 "symbol": symbol,
                 "mode": activation_mode,
-                "entry": float(entry_price),
-                "atr": float(atr_dbg) if atr_dbg is not None else None,
-                "activePrice": float(active_precise),
-                "callback_pct": float(cb_pct),
+                "entry": entry_price,
+                "atr": atr if activation_mode == "atr" else None,
+                "activePrice": active_precise,
+                "callback_pct": cb_pct,
             },
-            flush=True,
         )
-    except Exception as _e:
-        print("[TS_PARAMS_ERR]", _e, flush=True)
+
+    return active_precise, cb_pct
+
+
+def update_trailing_for_symbol(
+    exchange,
+    symbol: str,
+    entry_price: float,
+    side: str,
+    *,
+    stop_loss: float | None = None,
+    **params: Any,
+) -> Dict[str, Any]:
+    """
+    Устанавливает трейлинг-стоп (параметры — см. _resolve_trailing).
+    Если задан stop_loss — SL уходит в том же запросе (set_sl_and_trail).
+    """
+    active_precise, cb_pct = _resolve_trailing(
+        exchange, symbol, entry_price, side, **params
+    )
+
+    if stop_loss is not None:
+        return set_sl_and_trail(
+            exchange,
+            symbol,
+            sl=stop_loss,
+            active=active_precise,
+            cb=cb_pct,
+            side=side,
+        )
 
     # --- Установка трейлинга ---
     return set_trailing_stop_ccxt(
@@ -485,3 +871,46 @@ def update_trailing_for_symbol(
         trigger_by="LastPrice",
         side=side,
     )
+
+
+async def _set_many_async(
+    jobs: List[Tuple[str, float, float, str]], concurrency: int
+) -> List[Any]:
+    from core.bybit_async import create_async_exchange
+
+    sem = asyncio.Semaphore(concurrency)
+    aex = create_async_exchange()
+
+    async def _one(symbol: str, active: float, cb: float, side: str):
+        async with sem:
+            return await set_trailing_stop_async(aex, symbol, active, cb, side=side)
+
+    try:
+        return await asyncio.gather(
+            *[_one(*job) for job in jobs], return_exceptions=True
+        )
+    finally:
+        await aex.close()
+
+
+def update_trailing_many(
+    exchange,
+    positions: Iterable[Tuple[str, float, str]],
+    *,
+    concurrency: int = 8,
+    **params: Any,
+) -> Dict[str, Any]:
+    """
+    Трейлинг сразу для нескольких позиций [(symbol, entry, side), ...].
+    Параметры считаются синхронно (ATR из кеша по свече), POST-запросы
+    уходят параллельно: не больше `concurrency` одновременно, темп
+    ограничивает общий токен-бакет. Возвращает {symbol: ответ | исключение}.
+    """
+    jobs = []
+    for symbol, entry, side in positions:
+        active, cb = _resolve_trailing(exchange, symbol, entry, side, **params)
+        jobs.append((symbol, active, cb, side))
+    if not jobs:
+        return {}
+    results = asyncio.run(_set_many_async(jobs, concurrency))
+    return {job[0]: res for job, res in zip(jobs, results)}
@@ -1,21 +1,55 @@
 import argparse
 import os
+import time
+from datetime import datetime, timezone
 
+from .bybit_exchange import create_exchange, normalize_symbol
 from .env_loader import load_and_check_env
-from .predict import train_model_for_pair
+from .ohlcv_cache import timeframe_seconds
+from .predict import train_many as _train_many
 
+# Нижняя граница поиска даты листинга
+_EPOCH_MS = int(datetime(2010, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
 
-def train_many(pairs, timeframe="30m", limit=3000, model_dir="models"):
-    os.makedirs(model_dir, exist_ok=True)
-    for sym in pairs:
-        print(f"\n📈 Обучение модели для {sym}...")
-        try:
-            acc = train_model_for_pair(
-                sym, timeframe=timeframe, limit=limit, model_dir=model_dir
-            )
-            print(f"✅ {sym} — готово, вал.точность {acc:.4f}")
-        except Exception as e:
-            print(f"⚠️ {sym} — ошибка обучения: {e}")
+
+def find_listing_ts(exchange, symbol: str, tf: str = "1d") -> int:
+    """
+    Дата первой свечи пары (мс, с точностью до tf) бинарным поиском:
+    O(log диапазона) запросов по одной свече вместо пролистывания истории.
+    Проба "есть ли свеча не позже mid" — запрос с until=mid и limit=1.
+    """
+    tf_ms = timeframe_seconds(tf) * 1000
+    lo, hi = _EPOCH_MS, int(time.time() * 1000)
+    while hi - lo > tf_ms:
+        mid = (lo + hi) // 2
+        r = exchange.fetch_ohlcv(symbol, tf, limit=1, params={"until": mid})
+        if r:
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+def _train_since(exchange, symbol: str, timeframe: str, limit: int) -> int:
+    """Начало окна обучения: не раньше листинга и не глубже limit свечей."""
+    listing = find_listing_ts(exchange, normalize_symbol(symbol))
+    window_start = int(time.time() * 1000) - limit * timeframe_seconds(timeframe) * 1000
+    return max(listing, window_start)
+
+
+def train_many(
+    pairs, timeframe="30m", limit=3000, model_dir="models", from_listing=False
+):
+    pairs = list(pairs)
+    since = None
+    if from_listing and pairs:
+        # Отдельный клиент на время поиска листинга: общий get_exchange()
+        # с keep-alive потоком в родителе до форка пула не заводим
+        ex = create_exchange()
+        since = {sym: _train_since(ex, sym, timeframe, limit) for sym in pairs}
+    _train_many(
+        pairs, timeframe=timeframe, limit=limit, model_dir=model_dir, since=since
+    )
 
 
 def main():
@@ -29,6 +63,11 @@ def main():
     parser.add_argument(
         "--model-dir", type=str, default=os.getenv("MODEL_DIR", "models")
     )
+    parser.add_argument(
+        "--from-listing",
+        action="store_true",
+        help="не запрашивать историю раньше даты листинга пары",
+    )
     args = parser.parse_args()
 
     if args.pairs:
@@ -45,7 +84,11 @@ def main():
         print(f"[train_model] fallback pairs={pairs}")
 
     train_many(
-        pairs, timeframe=args.timeframe, limit=args.limit, model_dir=args.model_dir
+        pairs,
+        timeframe=args.timeframe,
+        limit=args.limit,
+        model_dir=args.model_dir,
+        from_listing=args.from_listing,
     )
 
 
@@ -1,15 +1,57 @@
 from __future__ import annotations
 
+import asyncio
 import os
+import random
+import threading
 import time
+from dataclasses import dataclass
 from typing import Any, Dict, Optional
 
-from core.bybit_exchange import create_exchange, normalize_symbol
+from core.bybit_async import (
+    create_async_exchange,
+    get_pro_exchange,
+    place_order,
+    run_in_ws_loop,
+    submit_to_ws_loop,
+)
+from core.bybit_exchange import get_exchange, normalize_symbol
 from core.indicators import atr_latest_from_ohlcv
-from core.market_info import adjust_qty_price
+from core.market_info import (
+    adjust_qty_price,
+    fetch_balance_cached,
+    fetch_ticker_cached,
+    round_price,
+)
+from core.ohlcv_cache import get_ohlcv
 from core.trade_log import append_trade_event
 
 
+@dataclass(frozen=True, slots=True)
+class TradingCfg:
+    """Параметры входа из окружения — разбираются один раз, а не на каждый ордер."""
+
+    leverage: int
+    timeframe: str
+    atr_period: int
+    sl_mult: float
+    tp_mult: float
+    risk_pct: float  # доля депозита под риск на сделку
+    dry_run: bool
+
+    @classmethod
+    def from_env(cls) -> "TradingCfg":
+        return cls(
+            leverage=int(os.getenv("LEVERAGE", "3")),
+            timeframe=os.getenv("TIMEFRAME", "5m"),
+            atr_period=int(os.getenv("ATR_PERIOD", "14")),
+            sl_mult=float(os.getenv("SL_ATR_MULT", "1.8")),
+            tp_mult=float(os.getenv("TP_ATR_MULT", "2.2")),
+            risk_pct=float(os.getenv("RISK_PCT", "0.007")),  # 0.7% от депозита
+            dry_run=os.getenv("DRY_RUN", "").strip() == "1",
+        )
+
+
 def _calc_order_qty(
     balance_usdt: float, price: float, risk_fraction: float, leverage: int
 ) -> float:
@@ -23,20 +65,31 @@ def _calc_order_qty(
     return (notional / price) if price > 1e-12 else 0.0
 
 
-def _wait_fill(ex, sym: str, order_id: str, timeout_s: int = 25) -> Dict[str, Any]:
+# Опрос статуса ордера: первый запрос через 100 мс, дальше x2 до 1 с
+FILL_POLL_BASE = 0.1
+FILL_POLL_MAX = 1.0
+FILL_POLL_JITTER = 0.1
+
+
+async def _wait_fill_async(
+    ex, sym: str, order_id: str, timeout_s: float = 25
+) -> Dict[str, Any]:
     """
-    Ожидаем финальный статус ордера до timeout_s.
+    Ожидаем финальный статус ордера до timeout_s (ex — async-клиент ccxt).
     Логируем промежуточные статусы. Если биржа не дала финал — возвращаем фолбэк 'placed'.
     """
-    t0 = time.time()
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()  # монотонные часы цикла: не зависят от NTP-коррекций
+    deadline = t0 + timeout_s
+    delay = FILL_POLL_BASE
     last: Dict[str, Any] = {}
-    while time.time() - t0 < timeout_s:
+    while loop.time() < deadline:
         try:
-            o = ex.fetch_order(order_id, sym) or {}
+            o = await ex.fetch_order(order_id, sym) or {}
             last = o or last
             st = str((o.get("status") or "")).lower()
             print(
-                f"[FILL] id={order_id} status={st or 'n/a'} ts={int(time.time()-t0)}s"
+                f"[FILL] id={order_id} status={st or 'n/a'} ts={loop.time() - t0:.1f}s"
             )
             # финальные статусы у ccxt: closed / canceled / rejected
             if st in ("closed", "canceled", "rejected", "open"):
@@ -45,7 +98,11 @@ def _wait_fill(ex, sym: str, order_id: str, timeout_s: int = 25) -> Dict[str, An
         except Exception as _e:
             # сеть/таймаут — пропускаем одной строкой; продолжаем ждать
             pass
-        time.sleep(0.5)
+        # Джиттер разводит опросы нескольких гардов; не спим дольше дедлайна
+        pause = min(delay + random.uniform(0, FILL_POLL_JITTER), deadline - loop.time())
+        if pause > 0:
+            await asyncio.sleep(pause)
+        delay = min(delay * 2, FILL_POLL_MAX)
 
     # Фолбэк: биржа не успела ответить, но id известен
     if last:
@@ -53,38 +110,126 @@ def _wait_fill(ex, sym: str, order_id: str, timeout_s: int = 25) -> Dict[str, An
     return {"status": "placed", "id": order_id, "symbol": sym}
 
 
+async def _wait_fill_once(sym: str, order_id: str, timeout_s: float) -> Dict[str, Any]:
+    ex = create_async_exchange()
+    try:
+        return await _wait_fill_async(ex, sym, order_id, timeout_s)
+    finally:
+        await ex.close()
+
+
+_FILL_FINAL = frozenset(("closed", "canceled", "rejected"))
+
+# Ожидание исполнения через websocket (watch_orders); 0 — только REST-опрос
+_FILL_VIA_WS = os.getenv("FILL_VIA_WS", "1") == "1"
+
+
+async def _watch_orders_prime(sym: str) -> None:
+    # Подписка до create_order: пуш о мгновенном исполнении не потеряется
+    await get_pro_exchange().watch_orders(sym)
+
+
+async def _wait_fill_ws(ex_pro, sym: str, oid: str) -> Dict[str, Any]:
+    """Ждёт финальный статус ордера из потока watch_orders (без REST-запросов)."""
+    while True:
+        # Апдейты, пришедшие до нашего ожидания, уже лежат в кеше клиента
+        for o in ex_pro.orders or ():
+            if o.get("id") == oid and o.get("status") in _FILL_FINAL:
+                return o
+        orders = await ex_pro.watch_orders(sym)
+        for o in orders:
+            if o.get("id") == oid and o.get("status") in _FILL_FINAL:
+                print(f"[FILL_WS] id={oid} status={o.get('status')}")
+                return o
+
+
+def _prime_fill_watch(sym: str) -> None:
+    """Заранее подписывается на ордера символа (если включён FILL_VIA_WS)."""
+    if not _FILL_VIA_WS:
+        return
+    try:
+        submit_to_ws_loop(_watch_orders_prime(sym))
+    except Exception as e:
+        print("[FILL_WS] prime failed:", e)
+
+
+def _wait_fill(sym: str, order_id: str, timeout_s: float = 25) -> Dict[str, Any]:
+    """
+    Финальный статус ордера: сначала через websocket (пуш биржи),
+    при ошибке/таймауте — REST-опрос _wait_fill_async.
+    """
+    rest_timeout = timeout_s
+    if _FILL_VIA_WS:
+        try:
+            return run_in_ws_loop(
+                asyncio.wait_for(
+                    _wait_fill_ws(get_pro_exchange(), sym, order_id), timeout_s
+                ),
+                timeout_s + 1,
+            )
+        except Exception as e:
+            print(f"[FILL_WS] fallback to REST: {type(e).__name__} {e}")
+            if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+                # Окно уже выждали — REST нужен только для актуального статуса
+                rest_timeout = min(timeout_s, 5)
+    return asyncio.run(_wait_fill_once(sym, order_id, rest_timeout))
+
+
+# Пары обрабатываются в потоках: вход по одной паре за раз, иначе несколько
+# входов одного прохода посчитают размер от одного и того же free USDT
+_OPEN_LOCK = threading.Lock()
+
+
 def open_position(
-    symbol: str, side: str, price: Optional[float] = None
+    symbol: str,
+    side: str,
+    price: Optional[float] = None,
+    cfg: Optional[TradingCfg] = None,
 ) -> Dict[str, Any]:
     """
     MARKET‑ордер с TP/SL и ATR‑расчётом. Игнорирует 'leverage not modified' (110043),
     помечает 10001 как retryable. Логирует: order_placed / order_filled / order_error.
     DRY_RUN=1 — не отправляет ордера.
+    cfg — настройки входа (TradingCfg); без него читаются из окружения.
+    Вызовы сериализуются: следующий вход видит баланс уже после предыдущего ордера.
     """
+    with _OPEN_LOCK:
+        return _open_position(symbol, side, price, cfg)
+
+
+def _open_position(
+    symbol: str,
+    side: str,
+    price: Optional[float],
+    cfg: Optional[TradingCfg],
+) -> Dict[str, Any]:
+    if cfg is None:
+        cfg = TradingCfg.from_env()
+
     # DRY mode: ничего не отправляем
-    if os.getenv("DRY_RUN", "").strip() == "1":
+    if cfg.dry_run:
         return {"status": "dry", "reason": "DRY_RUN=1", "symbol": symbol, "side": side}
 
-    ex = create_exchange()
+    ex = get_exchange()
     sym = normalize_symbol(symbol)
 
     # Баланс
-    bal = ex.fetch_balance()
+    bal = fetch_balance_cached()
     usdt = float(bal.get("USDT", {}).get("free", 0.0) or 0.0)
 
     # Цена (если не передали)
     if price is None:
-        t = ex.fetch_ticker(sym)
+        t = fetch_ticker_cached(sym)
         price = float(t.get("last") or t.get("close") or 0.0)
 
     # Округляем цену входа по тик‑шагу
-    px = float(ex.price_to_precision(sym, price))
+    px = round_price(sym, price, ex)
 
     # Сторона ордера
     order_side = "buy" if side.lower() == "long" else "sell"
 
     # Устанавливаем плечо (110043 = already set — не считается ошибкой)
-    leverage = int(os.getenv("LEVERAGE", "3"))
+    leverage = cfg.leverage
     try:
         ex.set_leverage(leverage, sym)
     except Exception as e:
@@ -92,14 +237,14 @@ def open_position(
             print("⚠️ set_leverage:", e)
 
     # --- ATR‑базированный риск ---
-    tf = os.getenv("TIMEFRAME", "5m")
-    atr_period = int(os.getenv("ATR_PERIOD", "14"))
-    sl_mult = float(os.getenv("SL_ATR_MULT", "1.8"))
-    tp_mult = float(os.getenv("TP_ATR_MULT", "2.2"))
-    risk_pct = float(os.getenv("RISK_PCT", "0.007"))  # 0.7% от депозита
+    tf = cfg.timeframe
+    atr_period = cfg.atr_period
+    sl_mult = cfg.sl_mult
+    tp_mult = cfg.tp_mult
+    risk_pct = cfg.risk_pct
 
     # Получаем ATR для стоп‑дистанции
-    ohlcv = ex.fetch_ohlcv(sym, timeframe=tf, limit=max(atr_period + 1, 200))
+    ohlcv = get_ohlcv(sym, tf, max(atr_period + 1, 200), ex=ex)
     atr, _last_close = atr_latest_from_ohlcv(ohlcv, period=atr_period)
 
     # Дистанция SL от точки входа
@@ -121,11 +266,11 @@ def open_position(
 
     # TP/SL по ATR
     if order_side == "buy":
-        sl_price = float(ex.price_to_precision(sym, px - stop_dist))
-        tp_price = float(ex.price_to_precision(sym, px + tp_mult * atr))
+        sl_price = round_price(sym, px - stop_dist, ex)
+        tp_price = round_price(sym, px + tp_mult * atr, ex)
     else:
-        sl_price = float(ex.price_to_precision(sym, px + stop_dist))
-        tp_price = float(ex.price_to_precision(sym, px - tp_mult * atr))
+        sl_price = round_price(sym, px + stop_dist, ex)
+        tp_price = round_price(sym, px - tp_mult * atr, ex)
 
     params = {"takeProfit": tp_price, "stopLoss": sl_price}
 
@@ -144,11 +289,13 @@ def open_position(
         },
     )
 
+    _prime_fill_watch(sym)
+
     try:
         # Размещение
-        o = ex.create_order(
-            sym, type="market", side=order_side, amount=qty, price=None, params=params
-        )
+        o = place_order(ex, sym, "market", order_side, qty, params=params)
+        # Маржа ушла в позицию — закешированный free USDT больше не актуален
+        fetch_balance_cached.cache_clear()
 
         # Лог: размещён
         try:
@@ -174,7 +321,7 @@ def open_position(
 
         oid = o.get("id") or o.get("orderId")
         if oid:
-            o = _wait_fill(ex, sym, oid)
+            o = _wait_fill(sym, oid)
         else:
             # редкий случай — ccxt не вернул id; всё равно вернём факт размещения
             o = {"status": (o.get("status") or "placed"), "symbol": sym}
@@ -1,32 +1,58 @@
 import argparse
+import asyncio
+import atexit
+import fcntl
+import logging
+import logging.handlers
 import os
+import queue
 import sys
 import tempfile
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Optional
 
-from core.bybit_exchange import create_exchange, normalize_symbol
-from core.env_loader import load_and_check_env
-from core.indicators import compute_snapshot
+from core.bybit_async import (
+    place_order,
+    start_ohlcv_stream,
+    start_position_stream,
+    start_ticker_stream,
+)
+from core.bybit_exchange import get_exchange, normalize_symbol
+from core.env_loader import load_and_check_env, reload_config
 from core.market_info import (
     cancel_open_orders,
+    fetch_ticker_cached,
     get_balance,
     get_open_orders,
+    get_positions,
     get_symbol_price,
     has_open_position,
+    prefetch_market_state,
+    round_amount,
+    round_price,
 )
-from core.predict import predict_trend, train_model_for_pair
+from core.ohlcv_cache import timeframe_seconds
 from core.trailing_stop import (
     compute_atr,
     set_stop_loss_only,
     update_trailing_for_symbol,
     verify_trailing_state,
 )
-from position_manager import open_position
+from position_manager import TradingCfg, open_position
 
 # --- Маяк старта и принудительная небеферизация ---
+# logs/boot.log открывается один раз; записью занимается фоновый
+# QueueListener — вызывающий поток только кладёт запись в очередь
+_boot_log = logging.getLogger("positions_guard.boot")
+_boot_log.setLevel(logging.INFO)
+_boot_log.propagate = False
 try:
     # Гарантируем небеферизованный stdout в любом окружении
     if hasattr(sys.stdout, "reconfigure"):
@@ -34,15 +60,47 @@ try:
     os.environ.setdefault("PYTHONUNBUFFERED", "1")
     # Локальный файл логов (на Railway тоже полезно)
     Path("logs").mkdir(exist_ok=True)
-    with open("logs/boot.log", "a", encoding="utf-8") as f:
-        f.write(
-            f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] BOOT: positions_guard.py loaded, cwd={os.getcwd()}\n"
-        )
+    _fh = logging.FileHandler("logs/boot.log", encoding="utf-8")
+    _fh.setFormatter(
+        logging.Formatter("[%(asctime)s] %(message)s", "%Y-%m-%d %H:%M:%S")
+    )
+    _boot_q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _boot_log.addHandler(logging.handlers.QueueHandler(_boot_q))
+    _boot_listener = logging.handlers.QueueListener(_boot_q, _fh)
+    _boot_listener.start()
+    # При выходе дописываем хвост очереди
+    atexit.register(_boot_listener.stop)
+    _boot_log.info("BOOT: positions_guard.py loaded, cwd=%s", os.getcwd())
     print("BOOT: positions_guard loaded", flush=True)
 except Exception:
     pass
 
 
+# --- Настройки из окружения: читаются один раз (.env уже загружен env_loader) ---
+_TRUE = ("1", "true", "True")
+_DEBUG_IND = os.getenv("DEBUG_INDICATORS", "0") == "1"
+_USE_TS = os.getenv("USE_TRAILING_STOP", "1") in _TRUE
+_ATR_TF = os.getenv("ATR_TIMEFRAME", "5m")
+_ATR_PERIOD = int(os.getenv("ATR_PERIOD", "14"))
+_MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "5"))
+
+_REGIME_BB_WIDTH_MIN = float(os.getenv("REGIME_BB_WIDTH_MIN", "0.012"))  # 1.2%
+_REGIME_EMA_SLOPE_MIN = float(os.getenv("REGIME_EMA_SLOPE_MIN", "0.0005"))
+_REGIME_RSI_LO = float(os.getenv("REGIME_RSI_NEUTRAL_LOW", "45"))
+_REGIME_RSI_HI = float(os.getenv("REGIME_RSI_NEUTRAL_HIGH", "55"))
+
+_PTP_ENABLE = os.getenv("PARTIAL_TP_ENABLE", "1") in _TRUE
+_PTP_PART = float(os.getenv("PARTIAL_TP_PART", "0.5"))
+_PTP_R_MULT = float(os.getenv("PARTIAL_TP_R_MULT", "1.0"))
+
+_BE_ENABLE = os.getenv("ENABLE_BREAKEVEN", "1") == "1"
+_BE_MODE = os.getenv("BE_MODE", "atr").lower()  # "atr" | "pct"
+_BE_OFFSET_PCT = float(os.getenv("BE_OFFSET_PCT", "0.0005"))  # ваш смещение BE
+_BE_EPSILON_PCT = float(os.getenv("BE_EPSILON_PCT", "0.0001"))  # ~0.01% страховка
+_BE_ATR_K = float(os.getenv("BE_ATR_K", "0.5"))
+_BE_TRIGGER_PCT = float(os.getenv("BE_TRIGGER_PCT", "0.004"))
+
+
 # --- Heartbeat в главном цикле: добавь вспомогательную функцию ---
 _last_hb = 0.0
 
@@ -53,16 +111,31 @@ def _heartbeat(msg: str = "HB"):
     now = time.time()
     if now - _last_hb >= 15:  # каждые ~15 секунд
         _last_hb = now
-        print(f"{time.strftime('%H:%M:%S')} {msg}", flush=True)
-        try:
-            with open("logs/boot.log", "a", encoding="utf-8") as f:
-                f.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {msg}\n")
-        except Exception:
-            pass
+        # stdout уже построчно буферизован — явный flush не нужен
+        print(f"{time.strftime('%H:%M:%S')} {msg}")
+        _boot_log.info(msg)
 
         # --- Режим рынка: фильтр от «пилы» перед входом ---
 
 
+# (symbol, timeframe, limit) -> (bar_bucket, snapshot): до новой свечи
+# свечи из кеша те же — и снимок индикаторов тот же
+_SNAP_CACHE: dict = {}
+
+
+def _snapshot(symbol: str, timeframe: str, limit: int) -> dict:
+    from core.indicators import compute_snapshot
+
+    bar = int(time.time() // timeframe_seconds(timeframe))
+    key = (symbol, timeframe, limit)
+    hit = _SNAP_CACHE.get(key)
+    if hit is not None and hit[0] == bar:
+        return hit[1]
+    snap = compute_snapshot(symbol, timeframe=timeframe, limit=limit)
+    _SNAP_CACHE[key] = (bar, snap)
+    return snap
+
+
 def _regime_ok(symbol: str, timeframe: str) -> bool:
     """
     Возвращает True, если рынок «здоровый» для входа:
@@ -71,28 +144,24 @@ def _regime_ok(symbol: str, timeframe: str) -> bool:
     - RSI не в «нейтральной» серой зоне.
     """
     try:
-        snap = compute_snapshot(symbol, timeframe=timeframe, limit=300)
+        snap = _snapshot(symbol, timeframe, 300)
         bb_width = float(snap.get("bb_width", 0.0) or 0.0)
         ema12 = float(snap.get("ema12", 0.0) or 0.0)
         ema26 = float(snap.get("ema26", 0.0) or 0.0)
         rsi14 = float(snap.get("rsi14", 50.0) or 50.0)
 
         # Порог ширины BB
-        bb_min = float(os.getenv("REGIME_BB_WIDTH_MIN", "0.012"))  # 1.2%
-        if bb_width < bb_min:
+        if bb_width < _REGIME_BB_WIDTH_MIN:
             return False
 
         # Наклон EMA50 примерно через ema12-ema26 (проксирует динамику)
-        ema_slope_min = float(os.getenv("REGIME_EMA_SLOPE_MIN", "0.0005"))
         base = max(1.0, (ema12 + ema26) / 2.0)
         slope = abs(ema12 - ema26) / base
-        if slope < ema_slope_min:
+        if slope < _REGIME_EMA_SLOPE_MIN:
             return False
 
         # Не торговать в «серой зоне» RSI
-        rsi_lo = float(os.getenv("REGIME_RSI_NEUTRAL_LOW", "45"))
-        rsi_hi = float(os.getenv("REGIME_RSI_NEUTRAL_HIGH", "55"))
-        if rsi_lo <= rsi14 <= rsi_hi:
+        if _REGIME_RSI_LO <= rsi14 <= _REGIME_RSI_HI:
             return False
 
         return True
@@ -118,19 +187,47 @@ def _has_trailing(exchange, symbol: str) -> bool:
     return False
 
 
-# Память о том, что безубыток уже переведён (по паре и направлению)
-_BE_DONE: dict = {}
+# Что уже сделано по текущей позиции: (symbol, "long"|"short") -> {"be", "ptp"}.
+# Сбрасывается, когда позиция по символу закрылась (_forget_position), —
+# следующая сделка на той же стороне снова получит BE/PTP.
+# Ограничена по размеру: в долгоживущем контейнере ключи не копятся вечно
+_DONE_MAX = 1024
+_POS_STATE: "OrderedDict[tuple, set]" = OrderedDict()
+
+
+def _pos_key(symbol: str, side: str) -> tuple:
+    return symbol, "long" if (side or "").lower() in ("long", "buy") else "short"
+
+
+def _is_done(symbol: str, side: str, flag: str) -> bool:
+    return flag in _POS_STATE.get(_pos_key(symbol, side), ())
+
+
+def _mark_done(symbol: str, side: str, flag: str) -> None:
+    key = _pos_key(symbol, side)
+    _POS_STATE.setdefault(key, set()).add(flag)
+    _POS_STATE.move_to_end(key)
+    if len(_POS_STATE) > _DONE_MAX:
+        _POS_STATE.popitem(last=False)
 
-_PTP_DONE: dict = {}  # key=(symbol, side_l) -> True
 
+def _forget_position(symbol: str) -> None:
+    """Позиции по символу нет — флаги BE/PTP прошлой сделки больше не действуют."""
+    _POS_STATE.pop((symbol, "long"), None)
+    _POS_STATE.pop((symbol, "short"), None)
 
-def _get_position_info(exchange, symbol: str):
+
+def _get_position_info(exchange, symbol: str, state: Optional[dict] = None):
     """
     Возвращает (qty_abs, side_l, entry_price) для открытой позиции по символу.
     side_l: 'long' | 'short' | '' (если позиции нет).
+    state — снимок prefetch_market_state: позиции берутся из него без запроса.
     """
     try:
-        positions = exchange.fetch_positions([symbol]) or []
+        if state and "positions" in state:
+            positions = get_positions(symbol, state)
+        else:
+            positions = exchange.fetch_positions([symbol]) or []
     except Exception:
         positions = []
     qty_abs, side_l, entry_px = 0.0, "", 0.0
@@ -161,27 +258,24 @@ def maybe_partial_take_profit(
       PARTIAL_TP_R_MULT=1.0     # во сколько ATR взять R (обычно 1)
       PARTIAL_TP_COOLDOWN_S=0   # минимальный интервал между попытками (сек)
     """
-    if os.getenv("PARTIAL_TP_ENABLE", "1") not in ("1", "true", "True"):
+    if not _PTP_ENABLE:
         return
     side_l = (side or "").lower()
     if side_l not in ("long", "short"):
         return
-    key = (symbol, side_l)
-    if _PTP_DONE.get(key):
+    if _is_done(symbol, side_l, "ptp"):
         return
 
-    part = float(os.getenv("PARTIAL_TP_PART", "0.5"))
-    r_mult = float(os.getenv("PARTIAL_TP_R_MULT", "1.0"))
+    part = _PTP_PART
+    r_mult = _PTP_R_MULT
 
     if atr <= 0 or entry_px <= 0:
         return
     cur = get_symbol_price(symbol)
-    passed = (
-        (cur >= entry_px + atr * r_mult)
-        if side_l == "long"
-        else (cur <= entry_px - atr * r_mult)
-    )
-    if not passed:
+    sgn = (
+        1.0 if side_l == "long" else -1.0
+    )  # знак направления: одна формула на обе стороны
+    if sgn * (cur - entry_px) < atr * r_mult:
         return
 
     qty_abs, _side_now, _entry_now = _get_position_info(exchange, symbol)
@@ -189,7 +283,7 @@ def maybe_partial_take_profit(
         return
     qty_close = max(0.0, qty_abs * part)
     try:
-        qty_close = float(exchange.amount_to_precision(symbol, qty_close))
+        qty_close = round_amount(symbol, qty_close, exchange)
     except Exception:
         pass
     if qty_close <= 0:
@@ -209,96 +303,126 @@ def maybe_partial_take_profit(
                 "r_mult": float(r_mult),
             },
         )
-        exchange.create_order(
+        place_order(
+            exchange,
             symbol,
-            type="market",
-            side=close_side,
-            amount=qty_close,
+            "market",
+            close_side,
+            qty_close,
             params={"reduceOnly": True},
         )
-        _PTP_DONE[key] = True
+        _mark_done(symbol, side_l, "ptp")
     except Exception as e:
         print("[PTP_ERR]", e)
 
 
-def _maybe_breakeven(exchange, symbol: str, entry_px: float, side: str) -> None:
+def _breakeven_price(
+    exchange,
+    symbol: str,
+    entry_px: float,
+    side: str,
+    current_price: Optional[float] = None,
+) -> Optional[float]:
     """
-    Переносит стоп-лосс в безубыток, если цена прошла достаточное расстояние.
+    Цена SL для безубытка, если цена прошла достаточное расстояние, иначе None.
+    current_price — уже известная цена (из снимка прохода), чтобы не ходить за тикером.
     Правило Bybit: лонг → SL ДОЛЖЕН быть НИЖЕ base_price (≈ entry);
                     шорт → SL ДОЛЖЕН быть ВЫШЕ base_price.
     Эту инварианту обеспечиваем через BE_EPSILON_PCT.
     """
-    if os.getenv("ENABLE_BREAKEVEN", "1") != "1":
-        return
+    if not _BE_ENABLE:
+        return None
 
     sid = (side or "").lower()
-    key = (symbol, sid)
-    if _BE_DONE.get(key):
-        return
+    if _is_done(symbol, sid, "be"):
+        return None
 
-    be_mode = os.getenv("BE_MODE", "atr").lower()  # "atr" | "pct"
-    be_offset_pct = float(os.getenv("BE_OFFSET_PCT", "0.0005"))  # ваш смещение BE
-    eps = float(os.getenv("BE_EPSILON_PCT", "0.0001"))  # ~0.01% страховка
+    be_mode = _BE_MODE
+    be_offset_pct = _BE_OFFSET_PCT
+    eps = _BE_EPSILON_PCT
 
     # Текущая цена
-    cur = get_symbol_price(symbol)
-    should_move = False
+    cur = current_price if current_price else get_symbol_price(symbol)
+    # Знак направления: +1 лонг, -1 шорт — одна формула на обе стороны
+    sgn = 1.0 if sid in ("long", "buy") else -1.0
+    gain = sgn * (cur - entry_px)
 
     if be_mode == "atr":
-        k = float(os.getenv("BE_ATR_K", "0.5"))
-        tf = os.getenv("ATR_TIMEFRAME", "5m")
-        per = int(os.getenv("ATR_PERIOD", "14"))
-        atr, _ = compute_atr(exchange, symbol, tf, per)
-        if atr > 0:
-            if sid in ("long", "buy"):
-                should_move = cur >= entry_px + k * atr
-            else:
-                should_move = cur <= entry_px - k * atr
+        atr, _ = compute_atr(exchange, symbol, _ATR_TF, _ATR_PERIOD)
+        should_move = atr > 0 and gain >= _BE_ATR_K * atr
     else:
-        trig = float(os.getenv("BE_TRIGGER_PCT", "0.004"))
-        if sid in ("long", "buy"):
-            should_move = cur >= entry_px * (1 + trig)
-        else:
-            should_move = cur <= entry_px * (1 - trig)
+        should_move = gain >= entry_px * _BE_TRIGGER_PCT
 
     if not should_move:
-        return
+        return None
 
     # --- КОРРЕКТНЫЙ BE ДЛЯ BYBIT (кламп вокруг entry) ---
+    # ваша целевая точка BE (с учётом offset), но Bybit требует
+    # SL < base_price для лонга и SL > base_price для шорта
+    limit_px = entry_px * (1 - sgn * eps)
     try:
-        if sid in ("long", "buy"):
-            # ваша целевая точка BE (с учётом offset)
-            desired = entry_px * (1 + be_offset_pct)
-            # но Bybit требует SL < base_price, поэтому клампим ниже entry:
-            be_raw = min(desired, entry_px * (1 - eps))
-        else:
-            desired = entry_px * (1 - be_offset_pct)
-            # для шорта SL > base_price:
-            be_raw = max(desired, entry_px * (1 + eps))
-
-        be_price = float(exchange.price_to_precision(symbol, be_raw))
+        desired = entry_px * (1 + sgn * be_offset_pct)
+        be_raw = min(desired, limit_px) if sgn > 0 else max(desired, limit_px)
+        be_price = round_price(symbol, be_raw, exchange)
     except Exception:
         # Фолбэк: ставим минимально допустимый с эпсилоном от entry
-        be_price = (
-            entry_px * (1 - eps) if sid in ("long", "buy") else entry_px * (1 + eps)
-        )
+        be_price = limit_px
         try:
-            be_price = float(exchange.price_to_precision(symbol, be_price))
+            be_price = round_price(symbol, be_price, exchange)
         except Exception:
             pass
+    return be_price
+
+
+def _maybe_breakeven(
+    exchange,
+    symbol: str,
+    entry_px: float,
+    side: str,
+    current_price: Optional[float] = None,
+) -> None:
+    """Переносит стоп-лосс в безубыток (см. _breakeven_price)."""
+    be_price = _breakeven_price(exchange, symbol, entry_px, side, current_price)
+    if be_price is None:
+        return
 
+    sid = (side or "").lower()
     print("[BE] move SL to", be_price)
     try:
         set_stop_loss_only(exchange, symbol, be_price, side=sid)
-        _BE_DONE[key] = True
+        _mark_done(symbol, sid, "be")
     except Exception as e:
         print("[BE_ERR]", e)
 
 
-def _get_entry_price(exchange, symbol: str) -> float:
-    """Возвращает entry price по символу (Bybit v5 через CCXT)."""
+def _trail_with_breakeven(
+    exchange,
+    symbol: str,
+    entry_px: float,
+    side: str,
+    current_price: Optional[float] = None,
+):
+    """
+    Ставит трейлинг; если одновременно пора в безубыток — SL уходит
+    тем же запросом trading-stop, а не вторым POST.
+    """
+    be_price = _breakeven_price(exchange, symbol, entry_px, side, current_price)
+    resp = update_trailing_for_symbol(
+        exchange, symbol, entry_px, side, stop_loss=be_price
+    )
+    if be_price is not None:
+        print("[BE] move SL to", be_price, "(with trailing)")
+        _mark_done(symbol, side, "be")
+    return resp
+
+
+def _get_entry_price(exchange, symbol: str, state: Optional[dict] = None) -> float:
+    """Возвращает entry price по символу (Bybit v5 через CCXT; state — снимок прохода)."""
     try:
-        poss = exchange.fetch_positions([symbol])
+        if state and "positions" in state:
+            poss = get_positions(symbol, state)
+        else:
+            poss = exchange.fetch_positions([symbol])
         for p in poss or []:
             if (p.get("symbol") or "").upper() == symbol.upper():
                 ep = (
@@ -321,10 +445,13 @@ def _get_entry_price(exchange, symbol: str) -> float:
     return 0.0
 
 
-def apply_trailing_after_entry(sym: str, signal: str, res: dict, dry_run: bool) -> None:
+def apply_trailing_after_entry(
+    sym: str, signal: str, res: dict, dry_run: bool, exchange=None
+) -> None:
     """
     Вешает трейлинг-стоп и переводит SL в безубыток сразу после успешного входа.
     Использует update_trailing_for_symbol и _maybe_breakeven().
+    exchange — клиент прохода; по умолчанию общий клиент процесса.
     """
     if (
         dry_run
@@ -346,21 +473,19 @@ def apply_trailing_after_entry(sym: str, signal: str, res: dict, dry_run: bool)
             try:
                 entry_px = get_symbol_price(sym)
             except Exception:
-                ex_tmp = create_exchange()
-                tkr = ex_tmp.fetch_ticker(sym)
+                tkr = fetch_ticker_cached(sym)
                 entry_px = float(tkr.get("last") or tkr.get("close") or 0.0)
 
-        ex_ts = create_exchange()
+        ex_ts = exchange or get_exchange()
 
-        if os.getenv("USE_TRAILING_STOP", "1") in ("1", "true", "True"):
+        if _USE_TS:
             if not _has_trailing(ex_ts, sym):
                 print("[TS_CALL]", {"symbol": sym, "entry": entry_px, "side": signal})
-                ts_resp = update_trailing_for_symbol(ex_ts, sym, entry_px, signal)
+                ts_resp = _trail_with_breakeven(ex_ts, sym, entry_px, signal)
                 print("[TS_OK]", ts_resp)
             else:
                 print("[TS_SKIP] already has trailing for", sym)
-
-            _maybe_breakeven(ex_ts, sym, entry_px, signal)
+                _maybe_breakeven(ex_ts, sym, entry_px, signal)
         else:
             print("[TS_SKIP] trailing disabled by USE_TRAILING_STOP")
     except Exception as e:
@@ -371,19 +496,21 @@ def apply_trailing_after_entry(sym: str, signal: str, res: dict, dry_run: bool)
 def single_instance_lock(name: str = "positions_guard.lock"):
     """
     Предохраняет от одновременного запуска нескольких копий скрипта.
-    Создаёт файл-замок в /tmp, удаляет его по завершении.
+    flock на файл в /tmp: захват атомарный, а ядро снимает блокировку
+    при смерти процесса (даже по SIGKILL) — зависших замков не бывает.
     """
     path = os.path.join(tempfile.gettempdir(), name)
-    if os.path.exists(path):
+    fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
         raise RuntimeError(f"Already running: {path}")
     try:
-        open(path, "w").close()
         yield
     finally:
-        try:
-            os.remove(path)
-        except Exception as e:
-            print(f"[WARN] lock cleanup failed: {e}")
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
 
 
 def ensure_models_exist(pairs, timeframe="15m", limit=2000, model_dir="models"):
@@ -391,138 +518,206 @@ def ensure_models_exist(pairs, timeframe="15m", limit=2000, model_dir="models"):
     Проверяет наличие моделей ML для всех пар, которые мы торгуем.
     Если модели нет – обучаем с нуля (train_model_for_pair).
     """
+    # xgboost/sklearn грузятся ~1 с — импортируем только когда нужны
+    from core.predict import pair_key, train_many
+
     os.makedirs(model_dir, exist_ok=True)
-    missing = []
-    for p in pairs:
-        key = normalize_symbol(p).upper().replace("/", "").replace(":USDT", "")
-        mpath = os.path.join(model_dir, f"model_{key}.pkl")
-        if not os.path.exists(mpath):
-            missing.append(p)
+    # Одно чтение каталога вместо stat на каждую пару
+    existing = {e.name for e in os.scandir(model_dir) if e.is_file()}
+    missing = [p for p in pairs if f"model_{pair_key(p)}.pkl" not in existing]
     if missing:
         print(f"🧠 Нет моделей для: {missing} — обучаем...")
-        for p in missing:
-            try:
-                train_model_for_pair(
-                    p, timeframe=timeframe, limit=limit, model_dir=model_dir
-                )
-            except Exception as e:
-                print(f"⚠️ {p}: {e}")
+        # Пары независимы — обучение в пуле процессов
+        train_many(missing, timeframe=timeframe, limit=limit, model_dir=model_dir)
 
 
-def _one_pass(pairs, args, dry_run):
-    """Один проход: обслуживание открытых позиций + попытка новых входов по всем парам."""
-    ex_loop = create_exchange()  # один клиент на итерацию
-    for p in pairs:
-        sym = normalize_symbol(p)
-        price = get_symbol_price(sym)
-        _heartbeat(f"cycle {p}")
+@dataclass(frozen=True, slots=True)
+class GuardOpts:
+    """Параметры прохода из CLI: неизменяемы, безопасно делятся между потоками."""
+
+    timeframe: str
+    threshold: float
+    limit: int
+    auto_cancel: bool
+    no_pyramid: bool
+
+
+def _handle_pair(p, opts, dry_run, ex_loop, state, cfg):
+    """Сопровождение позиции и попытка входа по одной паре (синхронно)."""
+    from core.predict import predict_trend
+
+    sym = normalize_symbol(p)
+    price = get_symbol_price(sym, state)
 
-        # --- Блок сопровождения: частичный выход 50% на 1R, если есть позиция ---
+    # Прогноз по паре считается не более одного раза за проход
+    pred_memo: dict = {}
+
+    def _pred() -> dict:
+        if not pred_memo:
+            pred_memo.update(predict_trend(sym, timeframe=opts.timeframe))
+        return pred_memo
+
+    _heartbeat(f"cycle {p}")
+
+    # Позиция закрылась — BE/PTP для следующей сделки снова разрешены
+    if "positions" in state and not has_open_position(sym, state):
+        _forget_position(sym)
+
+    # --- Блок сопровождения: частичный выход 50% на 1R, если есть позиция ---
+    try:
+        if has_open_position(sym, state):
+            atr_val, _ = compute_atr(
+                ex_loop,
+                sym,
+                _ATR_TF,
+                _ATR_PERIOD,
+            )
+            qty_abs, side_pos, entry_pos = _get_position_info(ex_loop, sym, state)
+            if qty_abs > 0 and side_pos:
+                maybe_partial_take_profit(ex_loop, sym, entry_pos, side_pos, atr_val)
+    except Exception as _e:
+        print("[PTP_WRAP_ERR]", _e)
+
+    # A) Обслуживание уже открытой позиции — восстановить трейл/проверить BE
+    try:
+        if has_open_position(sym, state):
+            ent = _get_entry_price(ex_loop, sym, state)
+            if ent > 0:
+                # Подсказка стороны из текущего сигнала (fallback=long)
+                side_hint = "long"
+                try:
+                    s = str(_pred().get("signal", "long")).lower()
+                    if s in ("short", "sell"):
+                        side_hint = "short"
+                except Exception:
+                    pass
+
+                if not _has_trailing(ex_loop, sym):
+                    print("[TS_RESTORE]", {"symbol": sym, "entry": ent})
+                    try:
+                        # Трейл и (если пора) BE — одним запросом
+                        ts_resp = _trail_with_breakeven(
+                            ex_loop, sym, ent, side_hint, price
+                        )
+                        print("[TS_OK]", ts_resp)
+                    except Exception as e:
+                        print("[TS_ERR]", e)
+                        _maybe_breakeven(ex_loop, sym, ent, side_hint, price)
+                else:
+                    # Проверка BE
+                    _maybe_breakeven(ex_loop, sym, ent, side_hint, price)
+    except Exception as e:
+        print("[MAINTAIN_ERR]", e)
+
+    # B) Открытые ордера?
+    opened = get_open_orders(sym, state)
+    if opened:
+        print(f"⏳ Есть открытые ордера по {sym}: {len(opened)}")
+        if opts.auto_cancel:
+            n = cancel_open_orders(sym)
+            print(f"🧹 Отменил {n} ордер(ов).")
+        else:
+            print("⏸ Пропускаю вход (запусти с --auto-cancel, чтобы чистить хвосты).")
+            return
+
+    # C) Пирамидинг?
+    if opts.no_pyramid and has_open_position(sym, state):
+        print(
+            f"🏕 Уже есть позиция по {sym} — пирамидинг выключен (--no-pyramid). Пропуск."
+        )
+        return
+
+    # D) Прогноз → вход
+    pred = _pred()
+    signal = str(pred.get("signal", "hold")).lower()
+    conf = float(pred.get("confidence", 0.0))
+
+    if not _regime_ok(sym, timeframe=opts.timeframe):
+        print("Режим рынка невалиден (BB/EMA/RSI) - пропуск входа.")
+        return
+
+    if _DEBUG_IND:
         try:
-            if has_open_position(sym):
-                ex_chk = create_exchange()
-                atr_val, _ = compute_atr(
-                    ex_chk,
-                    sym,
-                    os.getenv("ATR_TIMEFRAME", "5m"),
-                    int(os.getenv("ATR_PERIOD", "14")),
-                )
-                qty_abs, side_pos, entry_pos = _get_position_info(ex_chk, sym)
-                if qty_abs > 0 and side_pos:
-                    maybe_partial_take_profit(ex_chk, sym, entry_pos, side_pos, atr_val)
+            snap = _snapshot(sym, opts.timeframe, max(opts.limit, 200))
+            print("[IND]", sym, snap)
         except Exception as _e:
-            print("[PTP_WRAP_ERR]", _e)
+            print("[IND_ERR]", _e)
 
-        # A) Обслуживание уже открытой позиции — восстановить трейл/проверить BE
-        try:
-            if has_open_position(sym):
-                ent = _get_entry_price(ex_loop, sym)
-                if ent > 0:
-                    if not _has_trailing(ex_loop, sym):
-                        print("[TS_RESTORE]", {"symbol": sym, "entry": ent})
-                        try:
-                            # Подсказка стороны из текущего сигнала (fallback=long)
-                            side_hint = "long"
-                            try:
-                                s = str(
-                                    predict_trend(sym, timeframe=args.timeframe).get(
-                                        "signal", "long"
-                                    )
-                                ).lower()
-                                if s in ("short", "sell"):
-                                    side_hint = "short"
-                            except Exception:
-                                pass
-                            ts_resp = update_trailing_for_symbol(
-                                ex_loop, sym, ent, side_hint
-                            )
-                            print("[TS_OK]", ts_resp)
-                        except Exception as e:
-                            print("[TS_ERR]", e)
-                    # Проверка BE
-                    try:
-                        side_hint = "long"
-                        s2 = str(
-                            predict_trend(sym, timeframe=args.timeframe).get(
-                                "signal", "long"
-                            )
-                        ).lower()
-                        if s2 in ("short", "sell"):
-                            side_hint = "short"
-                    except Exception:
-                        side_hint = "long"
-                    _maybe_breakeven(ex_loop, sym, ent, side_hint)
-        except Exception as e:
-            print("[MAINTAIN_ERR]", e)
-
-        # B) Открытые ордера?
-        opened = get_open_orders(sym)
-        if opened:
-            print(f"⏳ Есть открытые ордера по {sym}: {len(opened)}")
-            if args.auto_cancel:
-                n = cancel_open_orders(sym)
-                print(f"🧹 Отменил {n} ордер(ов).")
-            else:
-                print(
-                    "⏸ Пропускаю вход (запусти с --auto-cancel, чтобы чистить хвосты)."
-                )
-                continue
+    print(
+        f"🔮 {sym} @ {price:.4f} → signal={signal} conf={conf:.2f} proba={pred.get('proba', {})}"
+    )
+    if dry_run or signal not in ("long", "short") or conf < opts.threshold:
+        print("⏸ Условия входа не выполнены (или DRY).")
+        return
 
-        # C) Пирамидинг?
-        if args.no_pyramid and has_open_position(sym):
-            print(
-                f"🏕 Уже есть позиция по {sym} — пирамидинг выключен (--no-pyramid). Пропуск."
-            )
-            continue
+    res = open_position(sym, side=signal, cfg=cfg)
+    print("🧾 Результат:", res)
+    apply_trailing_after_entry(sym, signal, res, dry_run, ex_loop)
 
-        # D) Прогноз → вход
-        pred = predict_trend(sym, timeframe=args.timeframe)
-        signal = str(pred.get("signal", "hold")).lower()
-        conf = float(pred.get("confidence", 0.0))
 
-        if not _regime_ok(sym, timeframe=args.timeframe):
-            print("Режим рынка невалиден (BB/EMA/RSI) - пропуск входа.")
-            continue
+class _PairStdout:
+    """
+    stdout, который в потоке пары копит вывод в буфер: лог пары печатается
+    одним куском по её завершении, а не вперемешку с соседними парами.
+    """
 
-        if os.getenv("DEBUG_INDICATORS", "0") == "1":
-            try:
-                snap = compute_snapshot(
-                    sym, timeframe=args.timeframe, limit=max(args.limit, 200)
-                )
-                print("[IND]", sym, snap)
-            except Exception as _e:
-                print("[IND_ERR]", _e)
+    def __init__(self, real):
+        self._real = real
 
-        print(
-            f"🔮 {sym} @ {price:.4f} → signal={signal} conf={conf:.2f} proba={pred.get('proba', {})}"
+    def write(self, s):
+        buf = getattr(_PAIR_LOCAL, "buf", None)
+        if buf is None:
+            return self._real.write(s)
+        buf.append(s)
+        return len(s)
+
+    def flush(self):
+        if getattr(_PAIR_LOCAL, "buf", None) is None:
+            self._real.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+
+_PAIR_LOCAL = threading.local()
+_OUT_LOCK = threading.Lock()
+# Постоянный пул: у каждого потока свой ccxt-клиент (get_exchange() на поток),
+# живущий между проходами; размер пула ограничивает одновременные пары
+_PAIR_POOL = ThreadPoolExecutor(
+    max_workers=_MAX_CONCURRENCY, thread_name_prefix="guard-pair"
+)
+
+
+def _run_pair(p, opts, dry_run, state, cfg):
+    _PAIR_LOCAL.buf = []
+    try:
+        _handle_pair(p, opts, dry_run, get_exchange(), state, cfg)
+    finally:
+        out = "".join(_PAIR_LOCAL.buf)
+        _PAIR_LOCAL.buf = None
+        with _OUT_LOCK:
+            sys.stdout.write(out)
+            sys.stdout.flush()
+
+
+async def _one_pass_async(pairs, opts, dry_run, cfg):
+    if not isinstance(sys.stdout, _PairStdout):
+        sys.stdout = _PairStdout(sys.stdout)
+    # Тикеры/позиции/ордера всех пар — тремя bulk-запросами на проход
+    state = prefetch_market_state(pairs)
+    # Пары обрабатываются параллельно в потоках пула, каждая своим клиентом
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        *(
+            loop.run_in_executor(_PAIR_POOL, _run_pair, p, opts, dry_run, state, cfg)
+            for p in pairs
         )
-        if dry_run or signal not in ("long", "short") or conf < args.threshold:
-            print("⏸ Условия входа не выполнены (или DRY).")
-            continue
+    )
 
-        res = open_position(sym, side=signal)
-        print("🧾 Результат:", res)
-        apply_trailing_after_entry(sym, signal, res, dry_run)
+
+def _one_pass(pairs, opts, dry_run, cfg):
+    """Один проход: обслуживание открытых позиций + попытка новых входов по всем парам."""
+    asyncio.run(_one_pass_async(pairs, opts, dry_run, cfg))
 
 
 def main():
@@ -581,6 +776,16 @@ def main():
         os.environ["DRY_RUN"] = "1"
     else:
         os.environ["DRY_RUN"] = "0"
+    reload_config()
+    # Настройки входа — один раз на процесс (после выставления DRY_RUN)
+    cfg = TradingCfg.from_env()
+    opts = GuardOpts(
+        timeframe=args.timeframe,
+        threshold=args.threshold,
+        limit=args.limit,
+        auto_cancel=args.auto_cancel,
+        no_pyramid=args.no_pyramid,
+    )
 
     print("──────── Kolopovstrategy guard ────────")
     print("⏱ ", datetime.now(timezone.utc).isoformat())
@@ -601,22 +806,33 @@ def main():
             print(f"⛔ Баланс ниже минимума ({min_balance} USDT) — торговля пропущена.")
             return
 
-        # 🔄 Новый блок вместо for p in pairs:
-    interval = max(1, int(args.check_interval))
-    if args.once:
-        _one_pass(pairs, args, dry_run)
-    else:
+        # Позиции, цены и свечи дальше приходят пушами
+        # (POSITIONS_VIA_WS / TICKERS_VIA_WS / OHLCV_VIA_WS), REST — фолбэк
+        start_position_stream()
+        syms = [normalize_symbol(p) for p in pairs]
+        start_ticker_stream(syms)
+        start_ohlcv_stream(syms, (args.timeframe, _ATR_TF))
+
+        # Цикл — под замком: иначе вторая копия стартует, как только первая
+        # прошла проверку баланса
+        interval = max(1, int(args.check_interval))
+        if args.once:
+            _one_pass(pairs, opts, dry_run, cfg)
+            return
+
         print(f"∞ Run loop started, CHECK_INTERVAL={interval}s", flush=True)
+        # Монотонный дедлайн: ровный шаг циклов, не зависящий от NTP-коррекций
+        deadline = time.monotonic()
         while True:
-            t0 = time.time()
-            _one_pass(pairs, args, dry_run)
+            deadline += interval
+            _one_pass(pairs, opts, dry_run, cfg)
             _heartbeat("sleep")
-            dt = time.time() - t0
-            left = max(0.0, interval - dt)
+            left = deadline - time.monotonic()
             if left > 0:
                 time.sleep(left)
-
-            # Больше ничего не делаем: apply_trailing_after_entry() ставит трейл и переводит в BE
+            elif left < -interval:
+                # Проход затянулся больше чем на цикл — не догоняем пропущенные
+                deadline = time.monotonic()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,32 @@
+import unittest
+
+from utils.error_handler import (
+    BybitAPIError,
+    _normalize_ret_fields,
+    assert_bybit_ok,
+    handle_bybit_error,
+)
+
+
+class NormalizeRetFieldsTest(unittest.TestCase):
+    def test_empty_retmsg_wins_over_legacy_key(self):
+        resp = {"retCode": 7, "retMsg": "", "ret_msg": "legacy"}
+        self.assertEqual(_normalize_ret_fields(resp), (7, ""))
+
+    def test_both_paths_agree_on_empty_retmsg(self):
+        resp = {"retCode": 7, "retMsg": "", "ret_msg": "legacy"}
+        msgs = []
+        for check in (handle_bybit_error, assert_bybit_ok):
+            with self.assertRaises(BybitAPIError) as cm:
+                check(resp)
+            msgs.append(str(cm.exception))
+        self.assertEqual(msgs, ["Bybit error retCode=7"] * 2)
+
+    def test_legacy_keys(self):
+        self.assertEqual(
+            _normalize_ret_fields({"ret_code": 0, "ret_msg": "OK"}), (0, "OK")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from core.ohlcv_cache import _merge_tail
+
+TF_MS = 300_000
+
+
+def _bar(ts, close=1.0):
+    return [ts, close, close, close, close, 0.0]
+
+
+class MergeTailTest(unittest.TestCase):
+    def setUp(self):
+        self.rows = [_bar(0), _bar(TF_MS)]
+
+    def test_adjacent_tail_is_appended(self):
+        merged = _merge_tail(self.rows, [_bar(2 * TF_MS)], 10, TF_MS)
+        self.assertEqual([r[0] for r in merged], [0, TF_MS, 2 * TF_MS])
+
+    def test_overlapping_tail_replaces_forming_bar(self):
+        tail = [_bar(TF_MS, 2.0), _bar(2 * TF_MS)]
+        merged = _merge_tail(self.rows, tail, 10, TF_MS)
+        self.assertEqual([r[0] for r in merged], [0, TF_MS, 2 * TF_MS])
+        self.assertEqual(merged[1][4], 2.0)
+
+    def test_gap_needs_full_fetch(self):
+        self.assertIsNone(_merge_tail(self.rows, [_bar(3 * TF_MS)], 10, TF_MS))
+
+    def test_window_is_capped(self):
+        merged = _merge_tail(self.rows, [_bar(2 * TF_MS)], 2, TF_MS)
+        self.assertEqual([r[0] for r in merged], [TF_MS, 2 * TF_MS])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,12 @@
 # tools/agent_guard.py
+import os
 import shutil
 import subprocess
 import sys
 import textwrap
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Optional, Tuple
 
 ROOT = Path(__file__).resolve().parent.parent
 
@@ -26,8 +29,9 @@ def run_capture(args) -> str:
     """Выполнить команду и вернуть stdout (без shell=True)."""
     if isinstance(args, str):
         args = args.split()
-    res = subprocess.run(args, capture_output=True, text=True, check=True)
-    return res.stdout
+    # Байты и одно декодирование в конце, без построчного text-режима
+    res = subprocess.run(args, capture_output=True, check=True)
+    return res.stdout.decode("utf-8", "replace")
 
 
 def ensure_file(path: Path, content: str) -> None:
@@ -58,10 +62,21 @@ def ensure_procfile() -> None:
     ensure_file(ROOT / "Procfile", content)
 
 
+def _try_import_one(mod: str) -> Tuple[str, bool, Optional[str]]:
+    """Импорт одного модуля (в отдельном процессе пула): (mod, ok, ошибка)."""
+    try:
+        __import__(mod)
+        return mod, True, None
+    except Exception as e:
+        return mod, False, str(e)
+
+
 def try_imports() -> bool:
     """
     Пытаемся импортировать все .py модули из репозитория.
     Если где-то ошибка импорта — печатаем и продолжаем.
+    Модули импортируются параллельно в пуле процессов: побочные эффекты
+    их top-level кода не попадают в текущий процесс.
     """
     ok = True
     git = shutil.which("git") or "git"
@@ -71,17 +86,21 @@ def try_imports() -> bool:
         print(f"[WARN] git ls-files failed: {e}")
         return False
 
-    for py in out.splitlines():
-        # переводим путь в модуль: a/b/c.py -> a.b.c
-        mod = py[:-3].replace("/", ".").replace("\\", ".")
-        if mod.endswith(".__init__"):
-            continue
-        try:
-            __import__(mod)
-            print(f"[import OK] {mod}")
-        except Exception as e:
-            ok = False
-            print(f"[import FAIL] {py}: {e}")
+    # переводим путь в модуль: a/b/c.py -> a.b.c
+    modules = [
+        m
+        for m in (
+            py[:-3].replace("/", ".").replace("\\", ".") for py in out.splitlines()
+        )
+        if not m.endswith(".__init__")
+    ]
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        for mod, mod_ok, err in pool.map(_try_import_one, modules):
+            if mod_ok:
+                print(f"[import OK] {mod}")
+            else:
+                ok = False
+                print(f"[import FAIL] {mod}: {err}")
     return ok
 
 
@@ -2,23 +2,42 @@ import py_compile
 import shutil
 import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
 
-git = shutil.which("git") or "git"
-res = subprocess.run(
-    [git, "ls-files", "*.py"], check=True, capture_output=True, text=True
-)
-files = res.stdout.splitlines
 
-if not files:
-    print("No Python files found.")
-    sys.exit(0)
-
-for f in files:
+def _compile_one(f: str) -> Tuple[str, Optional[str]]:
+    """Компилирует один файл; (путь, ошибка или None)."""
     try:
         py_compile.compile(f, doraise=True)
-        print(f"[OK] {f}")
+        return f, None
     except Exception as e:
-        print(f"[FAIL] {f}: {e}")
+        return f, str(e)
+
+
+def main() -> None:
+    git = shutil.which("git") or "git"
+    res = subprocess.run([git, "ls-files", "*.py"], check=True, capture_output=True)
+    files = res.stdout.decode("utf-8", "replace").splitlines()
+
+    if not files:
+        print("No Python files found.")
+        sys.exit(0)
+
+    # Файлы независимы — компилируем параллельно по ядрам
+    bad = False
+    with ProcessPoolExecutor() as ex:
+        for f, err in ex.map(_compile_one, files):
+            if err is None:
+                print(f"[OK] {f}")
+            else:
+                bad = True
+                print(f"[FAIL] {f}: {err}")
+
+    if bad:
         sys.exit(1)
+    print("Syntax OK")
+
 
-print("Syntax OK")
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
 from __future__ import annotations
 
 import logging
-from typing import Any, Dict, Iterable, Optional, Tuple
+import time
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
 
 logger = logging.getLogger("bybit")
 
+# Больше этого (по длине repr) payload в исключении не храним целиком:
+# вместо него {"_truncated": True, "keys": [...первые 16 ключей]}
+PAYLOAD_MAX_REPR = 4096
+
+_EMPTY_PAYLOAD: Mapping[str, Any] = MappingProxyType({})
+
 
 # === Специализированные исключения ===
 class BybitAPIError(Exception):
@@ -12,17 +21,44 @@ class BybitAPIError(Exception):
 
     def __init__(
         self,
-        message: str,
+        message: Optional[str],
         ret_code: Optional[int] = None,
         endpoint: Optional[str] = None,
         request_id: Optional[str] = None,
-        payload: Optional[Dict[str, Any]] = None,
+        payload: Optional[Mapping[str, Any]] = None,
+        retry_after: Optional[float] = None,
     ) -> None:
         super().__init__(message)
         self.ret_code = ret_code
         self.endpoint = endpoint
         self.request_id = request_id
-        self.payload = payload or {}
+        if payload and len(repr(payload)) > PAYLOAD_MAX_REPR:
+            # Пачки ордеров весят килобайты — в очередях ошибок держим только ключи
+            payload = {"_truncated": True, "keys": list(payload)[:16]}
+        # Общий read-only пустой payload вместо нового {} на каждое исключение
+        self.payload = payload if payload is not None else _EMPTY_PAYLOAD
+        # Подсказка биржи, через сколько секунд повторять (None — неизвестно)
+        self.retry_after = retry_after
+
+    def __str__(self) -> str:
+        # Текст для неизвестных кодов собираем лениво: чаще читают только ret_code
+        msg = self.args[0] if self.args else None
+        return msg if msg else f"Bybit error retCode={self.ret_code}"
+
+    def __reduce__(self):
+        # Поля — аргументами конструктора: общий пустой payload (mappingproxy)
+        # не pickle-ится, в __init__ он подставится заново
+        return (
+            type(self),
+            (
+                self.args[0] if self.args else None,
+                self.ret_code,
+                self.endpoint,
+                self.request_id,
+                None if self.payload is _EMPTY_PAYLOAD else self.payload,
+                self.retry_after,
+            ),
+        )
 
 
 class BybitInvalidParams(BybitAPIError):
@@ -34,7 +70,11 @@ class BybitAuthError(BybitAPIError):
 
 
 class BybitRateLimit(BybitAPIError):
-    """Лимиты частоты: retCode=10006 или HTTP 429."""
+    """
+    Лимиты частоты: retCode=10006 или HTTP 429.
+    retry_after — секунды до сброса лимита из заголовков ответа, если они были:
+    time.sleep(exc.retry_after or backoff_delay).
+    """
 
 
 class BybitNotModified(BybitAPIError):
@@ -55,9 +95,15 @@ def _normalize_ret_fields(resp: Dict[str, Any]) -> Tuple[Optional[int], str]:
     Возвращает (ret_code, ret_msg) из ответа Bybit.
     Поддерживает варианты ключей v5 и исторические: retCode/retMsg и ret_code/ret_msg.
     """
-    ret_code = resp.get("retCode", resp.get("ret_code"))
-    ret_msg = resp.get("retMsg", resp.get("ret_msg", "")) or ""
-    return ret_code, ret_msg
+    # Без дефолта-аргумента: он вычислялся бы всегда, даже при наличии retCode
+    g = resp.get
+    ret_code = g("retCode")
+    if ret_code is None:
+        ret_code = g("ret_code")
+    ret_msg = g("retMsg")
+    if ret_msg is None:
+        ret_msg = g("ret_msg")
+    return ret_code, ret_msg or ""
 
 
 # === Классификация кодов ===
@@ -68,6 +114,10 @@ _IGNORE_AS_SUCCESS_DEFAULT = frozenset(
     }
 )
 
+# Готовые наборы для ignore_codes (frozenset — быстрый путь без копий)
+IGNORE_LEVERAGE_UNCHANGED = frozenset({110043})
+IGNORE_NOT_MODIFIED = _IGNORE_AS_SUCCESS_DEFAULT
+
 # Ошибки, которые целесообразно ретраить с бэк-оффом
 _RETRYABLE_CODES = frozenset(
     {
@@ -112,20 +162,159 @@ _INVALID_PARAM_CODES = frozenset(
 )
 
 
-def is_success_response(resp: Dict[str, Any]) -> bool:
-    """Успех: retCode==0 или retMsg в стиле OK/success согласно гайду интеграции."""
-    ret_code, ret_msg = _normalize_ret_fields(resp)
+_OK_MARKERS = frozenset({"OK", "ok", "success", "SUCCESS", ""})
+
+
+def _is_success(ret_code: Optional[int], ret_msg: str) -> bool:
+    """Проверка успеха по уже нормализованным (ret_code, ret_msg)."""
     if ret_code == 0:
         return True
     # Иногда встречаются ответы с OK/success при retCode==0 — дополнительная страховка.
-    ok_markers = {"OK", "ok", "success", "SUCCESS", ""}
-    return (ret_code in (0, None)) and (ret_msg in ok_markers)
+    return ret_code is None and ret_msg in _OK_MARKERS
+
+
+def is_success_response(resp: Dict[str, Any]) -> bool:
+    """Успех: retCode==0 или retMsg в стиле OK/success согласно гайду интеграции."""
+    rc, rm = _normalize_ret_fields(resp)
+    # retCode==0 — 99% ответов: одно сравнение, без лишнего вызова
+    return rc == 0 or (rc is None and rm in _OK_MARKERS)
+
+
+def _build_dispatch() -> Dict[int, Tuple[type, str, bool]]:
+    """
+    retCode -> (класс исключения, сообщение по умолчанию, брать ли его вместо retMsg).
+    Порядок заполнения повторяет прежний приоритет проверок: первая группа побеждает.
+    """
+    table: Dict[int, Tuple[type, str, bool]] = {}
+    groups = (
+        # Частая причина при trading-stop — числа, переданные не как строки
+        (_INVALID_PARAM_CODES, BybitInvalidParams, "Invalid parameters"),
+        (_AUTH_CODES, BybitAuthError, "Auth/permission error"),
+        (
+            _INSUFFICIENT_FUNDS_CODES,
+            BybitInsufficientMargin,
+            "Insufficient margin/balance",
+        ),
+        # Рекомендуется перехватывать и ретраить с экспон. бэк-оффом вне этого модуля
+        (_RETRYABLE_CODES, BybitRateLimit, "Rate limited / temporary error"),
+    )
+    for codes, cls, default_msg in groups:
+        for code in codes:
+            table.setdefault(code, (cls, default_msg, False))
+    # Частные коды из UTA/Trade, которые удобно подсветить явно
+    table.setdefault(
+        110009, (BybitAPIError, "TP/SL/conditional orders limit exceeded", True)
+    )
+    table.setdefault(
+        110033, (BybitAPIError, "Can't set margin without an open position", True)
+    )
+    return table
+
+
+_CODE_DISPATCH = _build_dispatch()
+_UNKNOWN_CODE: Tuple[type, Optional[str], bool] = (BybitAPIError, None, False)
+
+
+@lru_cache(maxsize=256)
+def _classify(ret_code: Optional[int]) -> Tuple[type, Optional[str], bool]:
+    """retCode -> запись из _CODE_DISPATCH; неизвестные коды тоже кешируются."""
+    return _CODE_DISPATCH.get(ret_code, _UNKNOWN_CODE)
+
+
+def _header(headers: Dict[str, Any], name: str) -> Any:
+    v = headers.get(name)
+    return v if v is not None else headers.get(name.lower())
+
+
+def _retry_after_s(response: Dict[str, Any]) -> Optional[float]:
+    """
+    Секунды до повтора из заголовков ответа (_headers): Retry-After
+    или X-Bapi-Limit-Reset-Timestamp (мс, epoch) от Bybit.
+    """
+    headers = response.get("_headers")
+    if not headers:
+        return None
+    try:
+        v = _header(headers, "Retry-After")
+        if v is not None:
+            return max(float(v), 0.0)
+        v = _header(headers, "X-Bapi-Limit-Reset-Timestamp")
+        if v is not None:
+            return max(float(v) / 1000.0 - time.time(), 0.0)
+    except (TypeError, ValueError):
+        pass
+    return None
 
 
 def is_retryable(ret_code: Optional[int]) -> bool:
     return ret_code in _RETRYABLE_CODES
 
 
+def _error_for(
+    response: Dict[str, Any],
+    endpoint: Optional[str],
+    request_id: Optional[str],
+    payload: Optional[Dict[str, Any]],
+    ignore_codes: Optional[Iterable[int]],
+    raise_on_not_modified: bool,
+    _ret: Optional[Tuple[Optional[int], str]],
+) -> Optional[BybitAPIError]:
+    """Разбор ответа: None при успехе, иначе исключение (не поднятое)."""
+    # HTTP-уровень (если ваш HTTP-клиент прокидывает код ответа сюда)
+    http_status = response.get("_http_status")
+    if http_status != 429:
+        # Нормализуем retCode/retMsg (один раз на ответ, общим хелпером)
+        ret_code, ret_msg = _ret or _normalize_ret_fields(response)
+
+        # Быстрый выход на успех
+        if _is_success(ret_code, ret_msg):
+            return None
+
+    # Дальше только ошибки: контекст для исключений собираем один раз
+    ctx = {"endpoint": endpoint, "request_id": request_id, "payload": payload}
+
+    if http_status == 429:
+        # HTTP 429 = системная частотная защита (см. доки Bybit)
+        msg = "HTTP 429 Too Many Requests"
+        logger.warning(
+            "[Bybit][RATE_LIMIT][HTTP429] %s endpoint=%s reqId=%s",
+            msg,
+            endpoint,
+            request_id,
+        )
+        return BybitRateLimit(
+            msg, ret_code=10006, retry_after=_retry_after_s(response), **ctx
+        )
+
+    # Проверяем вхождение без сборки объединённого множества на каждый ответ;
+    # для set/frozenset это O(1), список/кортеж сканируется (обычно 1-2 кода)
+    if ret_code in _IGNORE_AS_SUCCESS_DEFAULT or (
+        ignore_codes and ret_code in ignore_codes
+    ):
+        # Либо совсем замалчиваем, либо поднимаем "мягко"
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "[Bybit][NOT_MODIFIED] retCode=%s msg=%s endpoint=%s",
+                ret_code,
+                ret_msg,
+                endpoint,
+            )
+        if raise_on_not_modified:
+            return BybitNotModified(ret_msg or "Not modified", ret_code=ret_code, **ctx)
+        return None
+
+    # Классификация: один кешированный поиск вместо каскада проверок
+    cls, default_msg, prefer_default = _classify(ret_code)
+    if prefer_default:
+        message = default_msg
+    else:
+        # Фоллбек: None — текст с retCode соберёт __str__, если его прочитают
+        message = ret_msg or default_msg
+    if ret_code == 10006:
+        ctx["retry_after"] = _retry_after_s(response)
+    return cls(message, ret_code=ret_code, **ctx)
+
+
 def handle_bybit_error(
     response: Dict[str, Any],
     *,
@@ -134,133 +323,71 @@ def handle_bybit_error(
     payload: Optional[Dict[str, Any]] = None,
     ignore_codes: Optional[Iterable[int]] = None,
     raise_on_not_modified: bool = False,
+    _ret: Optional[Tuple[Optional[int], str]] = None,
 ) -> None:
     """
         Унифицированная проверка ответа Bybit v5.
     - Игнорирует 'неизменённые' коды (110043, 34040) как успех, если не указан raise_on_not_modified=True.
         - Классифицирует и поднимает специализированные исключения.
+        - Для 429/10006 кладёт в BybitRateLimit.retry_after паузу из заголовков (_headers).
         - Ничего не возвращает при успехе, только исключения при ошибках.
 
         Параметры:
           response            — JSON dict от Bybit.
           endpoint / request_id / payload — опционально для логов/диагностики.
-          ignore_codes        — дополнительные коды, которые считать успешными.
+          ignore_codes        — дополнительные коды, которые считать успешными
+                                (лучше frozenset, напр. IGNORE_LEVERAGE_UNCHANGED).
           raise_on_not_modified — если True, 110043/34040 поднимаются как BybitNotModified.
+          _ret                — уже нормализованные (retCode, retMsg), если вызывающий их посчитал.
     """
-    # HTTP-уровень (если ваш HTTP-клиент прокидывает код ответа сюда)
-    http_status = response.get("_http_status")
-    if http_status == 429:
-        # HTTP 429 = системная частотная защита (см. доки Bybit)
-        msg = "HTTP 429 Too Many Requests"
-        logger.warning(
-            "[Bybit][RATE_LIMIT][HTTP429] %s endpoint=%s reqId=%s",
-            msg,
-            endpoint,
-            request_id,
-        )
-        raise BybitRateLimit(
-            msg,
-            ret_code=10006,
-            endpoint=endpoint,
-            request_id=request_id,
-            payload=payload,
-        )
-
-    # Нормализуем retCode/retMsg
-    ret_code, ret_msg = _normalize_ret_fields(response)
-
-    # Быстрый выход на успех
-    if is_success_response(response):
-        return
+    err = _error_for(
+        response,
+        endpoint,
+        request_id,
+        payload,
+        ignore_codes,
+        raise_on_not_modified,
+        _ret,
+    )
+    if err is not None:
+        raise err
 
-    code_to_ignore = set(_IGNORE_AS_SUCCESS_DEFAULT)
-    if ignore_codes:
-        code_to_ignore.update(ignore_codes)
 
-    if ret_code in code_to_ignore:
-        # Либо совсем замалчиваем, либо поднимаем "мягко"
-        logger.info(
-            "[Bybit][NOT_MODIFIED] retCode=%s msg=%s endpoint=%s",
-            ret_code,
-            ret_msg,
-            endpoint,
-        )
-        if raise_on_not_modified:
-            raise BybitNotModified(
-                ret_msg or "Not modified",
-                ret_code=ret_code,
-                endpoint=endpoint,
-                request_id=request_id,
-                payload=payload,
+def handle_bybit_error_batch(
+    responses: Sequence[Dict[str, Any]],
+    *,
+    endpoint: Optional[str] = None,
+    request_id_key: str = "reqId",
+    ignore_codes: Optional[Iterable[int]] = None,
+    raise_on_not_modified: bool = False,
+) -> List[Optional[BybitAPIError]]:
+    """
+    Пакетная проверка (пачка ack'ов из WS, batch-cancel/close): на каждый ответ
+    None при успехе или НЕ поднятое исключение. Что делать с ошибками —
+    поднять первую или собрать все — решает вызывающий.
+    request_id берётся из ответа по ключу request_id_key.
+    """
+    err_for = _error_for
+    out: List[Optional[BybitAPIError]] = []
+    append = out.append
+    for resp in responses:
+        g = resp.get
+        # retCode==0 без 429 — подавляющее большинство, без вызова разбора
+        if g("retCode") == 0 and g("_http_status") != 429:
+            append(None)
+            continue
+        append(
+            err_for(
+                resp,
+                endpoint,
+                g(request_id_key),
+                None,
+                ignore_codes,
+                raise_on_not_modified,
+                None,
             )
-        return
-
-    # Классификация
-    if ret_code in _INVALID_PARAM_CODES:
-        # Частая причина при trading-stop — числа, переданные не как строки
-        raise BybitInvalidParams(
-            ret_msg or "Invalid parameters",
-            ret_code=ret_code,
-            endpoint=endpoint,
-            request_id=request_id,
-            payload=payload,
-        )
-
-    if ret_code in _AUTH_CODES:
-        raise BybitAuthError(
-            ret_msg or "Auth/permission error",
-            ret_code=ret_code,
-            endpoint=endpoint,
-            request_id=request_id,
-            payload=payload,
         )
-
-    if ret_code in _INSUFFICIENT_FUNDS_CODES:
-        raise BybitInsufficientMargin(
-            ret_msg or "Insufficient margin/balance",
-            ret_code=ret_code,
-            endpoint=endpoint,
-            request_id=request_id,
-            payload=payload,
-        )
-
-    if is_retryable(ret_code):
-        # Рекомендуется перехватывать и ретраить с экспон. бэк-оффом вне этого модуля
-        raise BybitRateLimit(
-            ret_msg or "Rate limited / temporary error",
-            ret_code=ret_code,
-            endpoint=endpoint,
-            request_id=request_id,
-            payload=payload,
-        )
-
-    # Частные коды из UTA/Trade, которые удобно подсветить явно
-    if ret_code == 110009:
-        raise BybitAPIError(
-            "TP/SL/conditional orders limit exceeded",
-            ret_code=ret_code,
-            endpoint=endpoint,
-            request_id=request_id,
-            payload=payload,
-        )
-    if ret_code == 110033:
-        raise BybitAPIError(
-            "Can't set margin without an open position",
-            ret_code=ret_code,
-            endpoint=endpoint,
-            request_id=request_id,
-            payload=payload,
-        )
-
-    # Фоллбек
-    message = ret_msg or f"Bybit error retCode={ret_code}"
-    raise BybitAPIError(
-        message,
-        ret_code=ret_code,
-        endpoint=endpoint,
-        request_id=request_id,
-        payload=payload,
-    )
+    return out
 
 
 # === Утилита: безопасная проверка и логирование ===
@@ -276,14 +403,16 @@ def assert_bybit_ok(
     """
     Обёртка над handle_bybit_error с расширенным логированием входа/выхода.
     """
-    ret_code, ret_msg = _normalize_ret_fields(response)
-    logger.debug(
-        "[Bybit][RESP] retCode=%s retMsg=%s endpoint=%s reqId=%s",
-        ret_code,
-        ret_msg,
-        endpoint,
-        request_id,
-    )
+    ret = _normalize_ret_fields(response)
+    # isEnabledFor кеширует результат по уровню в самом логгере
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "[Bybit][RESP] retCode=%s retMsg=%s endpoint=%s reqId=%s",
+            ret[0],
+            ret[1],
+            endpoint,
+            request_id,
+        )
     handle_bybit_error(
         response,
         endpoint=endpoint,
@@ -291,4 +420,5 @@ def assert_bybit_ok(
         payload=payload,
         ignore_codes=ignore_codes,
         raise_on_not_modified=raise_on_not_modified,
+        _ret=ret,
     )